@@ -0,0 +1,792 @@
+#!/usr/bin/env python3.11
+"""
+Offline Benchmark Harness
+Runs main() end to end against a stub Reddit server, a fake OpenAI client and a fake Docs service
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+
+# reddit_automation is configured through module constants below; no real
+# credentials are needed, but the OpenAI SDK insists on a key being present
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import completion_cache
+import listing_cursors
+import question_index
+import metrics
+import reddit_automation
+import reddit_http
+import run_log
+import seen_posts
+import update_and_format_docs
+from metrics import METRICS, percentile
+from rate_limit import TokenBucket
+
+# ---------------------------------------------------------------------------
+# Stub Reddit server
+# ---------------------------------------------------------------------------
+
+class StubReddit:
+    """Local HTTP server serving synthetic /r/<name>/.json listings with ETags
+
+    Every call to advance() simulates one cron interval: `churn` new posts
+    appear at the top of each listing. Like real listings, the top post is a
+    stickied mod post and every 7th post is a link post. A fraction `throttle_rate` of requests
+    is answered with 429 + Retry-After to exercise the retry scheduler.
+    """
+
+    def __init__(self, posts_per_listing=25, churn=5, latency=0.0, throttle_rate=0.0, seed=0):
+        self.posts_per_listing = posts_per_listing
+        self.churn = churn
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.generation = 0
+        # Posts are 10 minutes apart, the oldest a day old, so listing cursors stay fresh
+        self.epoch = int(time.time()) - 86_400
+        self.requests = 0
+        self.not_modified = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def advance(self):
+        self.generation += 1
+
+    def listing(self, subreddit_name, limit=None, before=None):
+        newest = self.generation * self.churn + self.posts_per_listing
+        if before:
+            # The `limit` posts just newer than `before`, newest first
+            oldest = int(before.rsplit('_', 1)[1]) + 1
+            top = min(newest, oldest + (limit or 25) - 1)
+            children = [self.post(subreddit_name, n) for n in range(top, oldest - 1, -1)]
+            more = top < newest
+            return {'kind': 'Listing', 'data': {
+                'children': children, 'after': None, 'before': children[0]['data']['name'] if more else None
+            }}
+
+        size = min(limit or self.posts_per_listing, self.posts_per_listing)
+        children = [{'kind': 't3', 'data': {
+            'name': f"t3_{subreddit_name.lower()}_rules",
+            'title': f"Welcome to r/{subreddit_name} - read the rules before posting",
+            'selftext': "Be civil. No self-promotion.",
+            'author': 'AutoModerator',
+            'permalink': f"/r/{subreddit_name}/comments/rules/",
+            'score': 1,
+            'num_comments': 0,
+            'stickied': True,
+            'is_self': True,
+            'created_utc': self.epoch
+        }}]
+        children.extend(self.post(subreddit_name, n) for n in range(newest, newest - size + 1, -1))
+        return {'kind': 'Listing', 'data': {'children': children, 'after': None, 'before': None}}
+
+    def post(self, subreddit_name, n):
+        link = n % 7 == 0
+        return {'kind': 't3', 'data': {
+            'name': f"t3_{subreddit_name.lower()}_{n}",
+            'title': f"How do I handle a difficult situation with my team? (#{n})",
+            'selftext': '' if link else ("My manager keeps making every decision without asking the team. "
+                                         "Morale is low and nobody feels empowered to speak up. ") * 3,
+            'author': f"user{n}",
+            'permalink': f"/r/{subreddit_name}/comments/{n}/post_{n}/",
+            'score': n % 97,
+            'num_comments': n % 31,
+            'stickied': False,
+            'is_self': not link,
+            'created_utc': self.epoch + n * 600
+        }}
+
+    def handle(self, request):
+        with self._lock:
+            self.requests += 1
+            throttle = self._random.random() < self.throttle_rate
+        if self.latency:
+            time.sleep(self.latency)
+
+        if throttle:
+            with self._lock:
+                self.throttled += 1
+            request.send_response(429)
+            request.send_header('Retry-After', '0.2')
+            request.send_header('Content-Length', '0')
+            request.end_headers()
+            return
+
+        path, _, query = request.path.partition('?')
+        subreddit_name = path.split('/')[2]
+        query = dict(parse_qsl(query))
+        limit = query.get('limit')
+        etag = f'"{subreddit_name}-{self.generation}"'
+        if request.headers.get('If-None-Match') == etag:
+            with self._lock:
+                self.not_modified += 1
+            request.send_response(304)
+            request.end_headers()
+            return
+
+        body = json.dumps(self.listing(subreddit_name, int(limit) if limit else None, query.get('before'))).encode('utf-8')
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.send_header('ETag', etag)
+        request.send_header('x-ratelimit-remaining', '95')
+        request.send_header('x-ratelimit-reset', '300')
+        request.end_headers()
+        request.wfile.write(body)
+
+# ---------------------------------------------------------------------------
+# Fake OpenAI client
+# ---------------------------------------------------------------------------
+
+QUESTION_WORDS = """
+autonomy trust feedback meeting goal ritual manager team decision ownership burnout remote hiring
+conflict culture coaching delegation purpose strategy meaning listening humility accountability
+promotion silence morale empathy process bureaucracy experiment failure learning permission
+""".split()
+
+class FakeOpenAI:
+    """Stand-in for openai.OpenAI with configurable latency and token usage
+
+    Latency is `latency` seconds plus `per_token_latency` per completion token,
+    jittered by ±`jitter` (fraction). Prompt tokens are estimated from the
+    request size so prompt-size regressions show up in the token totals.
+    Streamed calls spread the same latency over STREAM_CHUNKS chunks, and a
+    fraction `invalid_rate` of them opens with chatter instead of JSON.
+    Prompt caching is modelled like OpenAI's: the longest prefix seen in an
+    earlier call, from `cache_min_tokens` in CACHE_STEP_TOKENS steps, is
+    reported as cached_tokens.
+    """
+
+    STREAM_CHUNKS = 20
+    CACHE_STEP_TOKENS = 128
+
+    def __init__(self, latency=0.3, per_token_latency=0.0, jitter=0.2, completion_tokens=250, seed=0,
+                 invalid_rate=0.0, cache_min_tokens=1024):
+        self.latency = latency
+        self.per_token_latency = per_token_latency
+        self.jitter = jitter
+        self.completion_tokens = completion_tokens
+        self.invalid_rate = invalid_rate
+        self.cache_min_tokens = cache_min_tokens
+        self.calls = 0
+        self._prefixes = set()
+        self.streamed_chunks = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self.create,
+            with_raw_response=SimpleNamespace(create=self.create_raw)
+        ))
+
+    def _reply(self, messages, params):
+        prompt = messages[-1]['content']
+        if params.get('response_format') and '"responses"' in prompt:
+            count = prompt.count('[POST ')
+            return json.dumps({'responses': [
+                {'post': i, 'response': f"Synthetic response {i}. " + 'Empowered teams listen first. ' * 20}
+                for i in range(1, count + 1)
+            ]})
+        if params.get('response_format'):
+            with self._lock:
+                n = self.calls
+                # Distinct bodies, so questions are not all near-duplicates of each other
+                words = ' '.join(self._random.choice(QUESTION_WORDS) for _ in range(120))
+            return json.dumps({'questions': [{
+                'title': f"Synthetic question {n}: do self-led teams outperform managed ones?",
+                'content': f"Consider a team that sets its own goals and rituals. {words}"
+            }]})
+        return 'Synthetic response. ' + 'Empathy and listening beat command and control. ' * 20
+
+    def _cached_tokens(self, messages):
+        """Tokens of the longest cacheable prefix of this prompt seen in an earlier call (4 chars per token)"""
+        prompt = ''.join(f"{m['role']}\n{m['content']}\n" for m in messages)
+        cached = 0
+        with self._lock:
+            hit = True
+            for tokens in range(self.cache_min_tokens, len(prompt) // 4 + 1, self.CACHE_STEP_TOKENS):
+                key = hash(prompt[:tokens * 4])
+                if hit and key in self._prefixes:
+                    cached = tokens
+                else:
+                    hit = False
+                self._prefixes.add(key)
+        return cached
+
+    def create(self, model, messages, temperature=None, stream=False, stream_options=None, **params):
+        with self._lock:
+            self.calls += 1
+            jitter = 1 + self._random.uniform(-self.jitter, self.jitter)
+            invalid = self._random.random() < self.invalid_rate
+        batch_size = max(1, messages[-1]['content'].count('[POST '))
+        completion_tokens = self.completion_tokens * batch_size
+        latency = (self.latency + self.per_token_latency * completion_tokens) * jitter
+
+        prompt_tokens = sum(len(m['content']) for m in messages) // 4
+        cached_tokens = self._cached_tokens(messages)
+        usage = SimpleNamespace(model_dump=lambda: {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens}
+        })
+        content = self._reply(messages, params)
+        if stream:
+            if invalid:
+                content = 'Sure! Here are the questions you asked for: ' + content
+            return FakeStream(self, model, content, usage, latency,
+                              include_usage=bool(stream_options and stream_options.get('include_usage')))
+
+        time.sleep(latency)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(model=model, usage=usage, choices=[SimpleNamespace(message=message)])
+
+    def create_raw(self, **kwargs):
+        response = self.create(**kwargs)
+        headers = {
+            'x-ratelimit-remaining-requests': '4999',
+            'x-ratelimit-reset-requests': '12ms'
+        }
+        return SimpleNamespace(headers=headers, parse=lambda: response)
+
+class FakeStream:
+    """Iterator of chat.completion.chunk-like objects, paced to the client's latency"""
+
+    def __init__(self, client, model, content, usage, latency, include_usage):
+        self.client = client
+        self.model = model
+        self.content = content
+        self.usage = usage
+        self.latency = latency
+        self.include_usage = include_usage
+        self.closed = False
+
+    def __iter__(self):
+        size = max(1, -(-len(self.content) // FakeOpenAI.STREAM_CHUNKS))
+        pieces = [self.content[i:i + size] for i in range(0, len(self.content), size)]
+        for piece in pieces:
+            if self.closed:
+                return
+            time.sleep(self.latency / len(pieces))
+            with self.client._lock:
+                self.client.streamed_chunks += 1
+            delta = SimpleNamespace(content=piece)
+            yield SimpleNamespace(model=self.model, usage=None, choices=[SimpleNamespace(delta=delta)])
+        if self.include_usage and not self.closed:
+            yield SimpleNamespace(model=self.model, usage=self.usage, choices=[])
+
+    def close(self):
+        self.closed = True
+
+# ---------------------------------------------------------------------------
+# Fake Google Docs service
+# ---------------------------------------------------------------------------
+
+class _Response:
+    """Minimal httplib2-style response for HttpError"""
+
+    def __init__(self, status):
+        self.status = status
+        self.reason = 'Bad Request'
+
+class _Call:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+class FakeDocsService:
+    """In-memory Docs service whose documents grow with every append
+
+    documents().get cost scales with the size of the returned payload
+    (`get_latency` + `per_kb_latency` per KB), like the real API, so
+    full-document reads get slower as the documents grow.
+
+    Documents keep their text as UTF-16 code units, the unit of Docs
+    indexes, with a bold flag per unit. insertText and updateTextStyle are
+    applied in order, and an index outside the body or inside a surrogate
+    pair is rejected with a 400, as the real API does. line_styles() reads
+    back which lines ended up bold.
+    """
+
+    def __init__(self, initial_chars=0, get_latency=0.05, per_kb_latency=0.0005, update_latency=0.1):
+        self.get_latency = get_latency
+        self.per_kb_latency = per_kb_latency
+        self.update_latency = update_latency
+        self.initial_chars = initial_chars
+        self.docs = {}
+        self.gets = 0
+        self.updates = 0
+        self.creates = 0
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def _new_doc(self, paragraphs=0):
+        # Pre-existing history, as ~100-character paragraphs. Index 0 is the
+        # section break and the body's final newline stays at index `length`.
+        text = bytearray(('x' * 99 + '\n').encode('utf-16-le') * paragraphs)
+        return {'length': 1 + paragraphs * 100, 'paragraphs': 1 + paragraphs, 'revision': 1,
+                'text': text, 'bold': bytearray(len(text) // 2)}
+
+    def _doc(self, doc_id):
+        if doc_id not in self.docs:
+            self.docs[doc_id] = self._new_doc(self.initial_chars // 100)
+        return self.docs[doc_id]
+
+    @staticmethod
+    def _splits_pair(doc, index):
+        """Whether a Docs index falls between the two halves of a surrogate pair"""
+        offset = 2 * (index - 1)
+        if offset <= 0 or offset >= len(doc['text']):
+            return False
+        unit = int.from_bytes(doc['text'][offset:offset + 2], 'little')
+        return 0xDC00 <= unit <= 0xDFFF
+
+    def _apply(self, doc, request):
+        """Apply one request to a document; returns an error message if the API would reject it"""
+        if 'insertText' in request:
+            index = request['insertText']['location']['index']
+            if not 1 <= index <= doc['length'] or self._splits_pair(doc, index):
+                return f"insertText index {index} outside the body (1..{doc['length']}) or inside a surrogate pair"
+            text = request['insertText']['text']
+            units = text.encode('utf-16-le')
+            offset = 2 * (index - 1)
+            doc['text'][offset:offset] = units
+            doc['bold'][index - 1:index - 1] = bytes(len(units) // 2)
+            doc['length'] += len(units) // 2
+            doc['paragraphs'] += text.count('\n')
+        elif 'updateTextStyle' in request:
+            style = request['updateTextStyle']
+            start, end = style['range']['startIndex'], style['range']['endIndex']
+            if not 1 <= start < end <= doc['length'] or self._splits_pair(doc, start) or self._splits_pair(doc, end):
+                return f"updateTextStyle range {start}..{end} outside the body (1..{doc['length']}) or splits a character"
+            if 'bold' in style['fields'].split(','):
+                doc['bold'][start - 1:end - 1] = (b'\x01' if style['textStyle'].get('bold') else b'\x00') * (end - start)
+        return None
+
+    def line_styles(self, doc_id):
+        """(line, 'bold' | 'plain' | 'mixed') for every non-empty line of a document's text"""
+        with self._lock:
+            doc = self._doc(doc_id)
+            text = doc['text'].decode('utf-16-le')
+            bold = bytes(doc['bold'])
+        styles = []
+        offset = 0
+        for line in text.split('\n'):
+            length = update_and_format_docs.utf16_len(line)
+            if length:
+                flags = set(bold[offset:offset + length])
+                styles.append((line, 'mixed' if len(flags) > 1 else 'bold' if 1 in flags else 'plain'))
+            offset += length + 1
+        return styles
+
+    def documents(self):
+        return self
+
+    def get(self, documentId, fields=None):
+        def execute():
+            with self._lock:
+                doc = self._doc(documentId)
+                self.gets += 1
+                # A field mask only returns endIndex per element; a full read returns all text
+                payload = doc['paragraphs'] * 24 if fields else doc['length'] + doc['paragraphs'] * 200
+                self.bytes_read += payload
+                end_index = doc['length'] + 1
+                revision = doc['revision']
+            time.sleep(self.get_latency + self.per_kb_latency * payload / 1024)
+            return {
+                'title': f"Document {documentId}",
+                'revisionId': str(revision),
+                'body': {'content': [{'endIndex': 1}, {'endIndex': end_index}]}
+            }
+        return _Call(execute)
+
+    def create(self, body):
+        def execute():
+            time.sleep(self.update_latency)
+            with self._lock:
+                self.creates += 1
+                doc_id = f"segment-{self.creates}"
+                self.docs[doc_id] = self._new_doc()
+            return {'documentId': doc_id, 'title': body.get('title'), 'revisionId': '1'}
+        return _Call(execute)
+
+    def batchUpdate(self, documentId, body):
+        def execute():
+            from googleapiclient.errors import HttpError
+
+            time.sleep(self.update_latency)
+            with self._lock:
+                doc = self._doc(documentId)
+                required = (body.get('writeControl') or {}).get('requiredRevisionId')
+                if required and required != str(doc['revision']):
+                    raise HttpError(_Response(400), b'{"error": {"message": "revision mismatch"}}')
+                # A batch is atomic: validate and apply on a copy, keep it only if every request is valid
+                updated = dict(doc, text=bytearray(doc['text']), bold=bytearray(doc['bold']))
+                for request in body['requests']:
+                    error = self._apply(updated, request)
+                    if error:
+                        raise HttpError(_Response(400), json.dumps({'error': {'message': error}}).encode('utf-8'))
+                doc.update(updated)
+                doc['revision'] += 1
+                self.updates += 1
+                return {'documentId': documentId, 'writeControl': {'requiredRevisionId': str(doc['revision'])}}
+        return _Call(execute)
+
+def misplaced_bold(styles):
+    """Lines whose style disagrees with update_and_format_docs.should_bold, as (line, style) pairs"""
+    return [(line, style) for line, style in styles
+            if style != ('bold' if update_and_format_docs.should_bold(line) else 'plain')]
+
+def check_bold_offsets():
+    """Append formatted blocks with emoji, em dashes and █ bars to a fake Doc and check which lines end up bold
+
+    Goes through the real append path (update_and_format_docs.build_append_requests),
+    twice, so the second append starts at an index shifted by astral
+    characters. Returns the misplaced lines as (line, style) pairs, or the
+    rejected batch's error as (message, 'rejected'); empty if every range is right.
+    """
+    docs = FakeDocsService(get_latency=0, per_kb_latency=0, update_latency=0)
+    questions = [
+        {'title': "🚀 Does your team ship faster when you stop tracking velocity? 👩\u200d💻",
+         'content': "Half the retros I've run end in blame — what changed when yours didn't? 🤔"},
+        {'title': "Plain question — no emoji here?", 'content': "Body with 𝔣𝔞𝔫𝔠𝔶 letters and a ████ bar."}
+    ]
+    post = {'title': "Burned out 😩 after a re-org", 'author': 'user🙂', 'url': 'https://reddit.com/r/x/1',
+            'selftext': '', 'subreddit': 'managers'}
+    text = (reddit_automation.format_questions_content('managers', questions, '2026-01-01 00:00:00') +
+            reddit_automation.format_responses_content('managers', [{'post': post, 'response': "Breathe 🌬️ — then talk."}],
+                                                       '2026-01-01 00:00:00'))
+    from googleapiclient.errors import HttpError
+
+    for _ in range(2):
+        start = docs.documents().get(documentId='check').execute()['body']['content'][-1]['endIndex'] - 1
+        try:
+            docs.batchUpdate(documentId='check',
+                             body={'requests': update_and_format_docs.build_append_requests(start, text)}).execute()
+        except HttpError as e:
+            return [(e.reason, 'rejected')]
+
+    styles = docs.line_styles('check')
+    problems = misplaced_bold(styles)
+    # should_bold itself must keep the bars plain and the emoji headers bold
+    for line, style in styles:
+        if '█' in line and style != 'plain':
+            problems.append((line, style))
+        if line.startswith(('TITLE: 🚀', 'QUESTION 1 —', 'POST: Burned out 😩')) and style != 'bold':
+            problems.append((line, style))
+    return problems
+
+# ---------------------------------------------------------------------------
+# Harness
+# ---------------------------------------------------------------------------
+
+def make_subreddits(count, base_url):
+    """`count` subreddit configs pointing at the stub server, cycling through the real ones"""
+    real = list(reddit_automation.SUBREDDITS.items())
+    subreddits = {}
+    for i in range(count):
+        name, config = real[i % len(real)]
+        if i >= len(real):
+            name = f"{name}{i // len(real)}"
+        subreddits[name] = dict(config, url=f"{base_url}/r/{name}/.json")
+    return subreddits
+
+@contextlib.contextmanager
+def sandbox(work_dir, subreddits, openai_client, docs_service,
+            openai_rate=reddit_automation.OPENAI_RATE, reddit_rate=reddit_http.REDDIT_RATE):
+    """Point every path, client and service used by main() at local stand-ins
+
+    The shared OpenAI and Reddit limiters are replaced by fresh, full buckets
+    refilling at openai_rate/reddit_rate, so a scenario never inherits the
+    throttling left behind by the one before it.
+    """
+    patches = [
+        (reddit_automation, 'client', openai_client),
+        (reddit_automation, 'OPENAI_LIMITER',
+         TokenBucket('openai', rate=openai_rate, capacity=reddit_automation.OPENAI_BURST)),
+        (reddit_http, 'REDDIT_LIMITER', TokenBucket('reddit', rate=reddit_rate, capacity=reddit_http.REDDIT_BURST)),
+        (reddit_automation, 'SUBREDDITS', subreddits),
+        (reddit_automation, 'OUTPUT_DIR', work_dir),
+        (reddit_automation, 'ALL_QUESTIONS_FILE', os.path.join(work_dir, 'all_questions.txt')),
+        (reddit_automation, 'ALL_RESPONSES_FILE', os.path.join(work_dir, 'all_responses.txt')),
+        (reddit_automation, 'BOOK_SUMMARY_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book_summary.md')),
+        (reddit_automation, 'METRICS_DIR', os.path.join(work_dir, 'run_metrics')),
+        (reddit_automation, 'METRICS_PROM_FILE', None),
+        (reddit_automation, '_completion_cache', None),
+        (reddit_automation, '_question_index', None),
+        (question_index, 'INDEX_FILE', os.path.join(work_dir, 'question_index.bin')),
+        (reddit_http, 'CACHE_DIR', os.path.join(work_dir, 'http_cache')),
+        (reddit_http, 'CACHE_MAX_AGE', 0),
+        (seen_posts, 'SEEN_POSTS_FILE', os.path.join(work_dir, 'seen_posts.txt')),
+        (listing_cursors, 'CURSORS_FILE', os.path.join(work_dir, 'listing_cursors.json')),
+        (completion_cache, 'CACHE_FILE', os.path.join(work_dir, 'completion_cache.db')),
+        (run_log, 'RUN_LOG_DIR', os.path.join(work_dir, 'run_log')),
+        (metrics, 'METRICS_DIR', os.path.join(work_dir, 'run_metrics')),
+        (update_and_format_docs, 'DOCS_STATE_FILE', os.path.join(work_dir, 'docs_state.json')),
+        (update_and_format_docs, 'DOCS_SEGMENTS_FILE', os.path.join(work_dir, 'docs_segments.json')),
+        (update_and_format_docs, '_service', docs_service),
+    ]
+    saved = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+
+def run_scenario(name, subreddit_count, workers, runs, openai_latency, reddit_latency, doc_chars,
+                 throttle_rate=0.0, invalid_rate=0.0, cache_min_tokens=1024,
+                 openai_rate=reddit_automation.OPENAI_RATE, reddit_rate=reddit_http.REDDIT_RATE, verbose=False):
+    """Run main() `runs` times (one simulated cron tick each) and summarize"""
+    work_dir = tempfile.mkdtemp(prefix='reddit_bench_')
+    stub = StubReddit(latency=reddit_latency, throttle_rate=throttle_rate).start()
+    client = FakeOpenAI(latency=openai_latency, invalid_rate=invalid_rate, cache_min_tokens=cache_min_tokens)
+    docs = FakeDocsService(initial_chars=doc_chars)
+    subreddits = make_subreddits(subreddit_count, stub.base_url)
+
+    run_times = []
+    stage_samples = {}
+    items = 0
+    prompt_tokens = 0
+    cached_tokens = 0
+    try:
+        with sandbox(work_dir, subreddits, client, docs, openai_rate=openai_rate, reddit_rate=reddit_rate):
+            for _ in range(runs):
+                stub.advance()
+                output = sys.stdout if verbose else io.StringIO()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(output):
+                    reddit_automation.main(max_workers=workers)
+                run_times.append(time.perf_counter() - start)
+
+                summary = METRICS.summary()
+                items += summary['counters'].get('questions', 0) + summary['counters'].get('responses', 0)
+                prompt_tokens += sum(totals.get('prompt_tokens', 0) for totals in summary['tokens'].values())
+                cached_tokens += sum(totals.get('prompt_cached_tokens', 0) for totals in summary['tokens'].values())
+                for stage, stats in summary['stages'].items():
+                    stage_samples.setdefault(stage, []).append(stats['p95_s'])
+    finally:
+        stub.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    ordered = sorted(run_times)
+    total = sum(run_times)
+    return {
+        'scenario': name,
+        'subreddits': subreddit_count,
+        'workers': workers,
+        'runs': runs,
+        'doc_chars': doc_chars,
+        'openai_rate': openai_rate,
+        'reddit_rate': reddit_rate,
+        'run_p50_s': round(percentile(ordered, 50), 3),
+        'run_p95_s': round(percentile(ordered, 95), 3),
+        'subreddits_per_s': round(subreddit_count * runs / total, 2),
+        'items_per_s': round(items / total, 2),
+        'openai_calls': client.calls,
+        'openai_streamed_chunks': client.streamed_chunks,
+        'openai_prompt_tokens': prompt_tokens,
+        'openai_cached_tokens': cached_tokens,
+        'reddit_requests': stub.requests,
+        'reddit_304s': stub.not_modified,
+        'reddit_429s': stub.throttled,
+        'docs_gets': docs.gets,
+        'docs_updates': docs.updates,
+        'docs_creates': docs.creates,
+        'docs_kb_read': round(docs.bytes_read / 1024, 1),
+        'docs_misplaced_bold': sum(len(misplaced_bold(docs.line_styles(doc_id))) for doc_id in list(docs.docs)),
+        'stage_p95_s': {stage: round(max(samples), 4) for stage, samples in sorted(stage_samples.items())}
+    }
+
+# ---------------------------------------------------------------------------
+# Startup
+# ---------------------------------------------------------------------------
+
+# Budget for `import reddit_automation` in a fresh interpreter, and the heavy
+# libraries that must only be imported once they are actually used
+IMPORT_BUDGET_MS = 250
+LAZY_MODULES = ('openai', 'googleapiclient', 'google.oauth2', 'numpy')
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import reddit_automation
+elapsed = time.perf_counter() - start
+print(json.dumps({'import_ms': elapsed * 1000, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+FETCH_PROBE = """
+import contextlib, io, json, os, sys
+import reddit_automation, reddit_http, listing_cursors, seen_posts
+work_dir, subreddits, book_file = sys.argv[1], json.loads(sys.argv[2]), sys.argv[3]
+reddit_http.CACHE_DIR = os.path.join(work_dir, 'http_cache')
+listing_cursors.CURSORS_FILE = os.path.join(work_dir, 'listing_cursors.json')
+seen_posts.SEEN_POSTS_FILE = os.path.join(work_dir, 'seen_posts.txt')
+reddit_automation.SUBREDDITS = subreddits
+reddit_automation.BOOK_SUMMARY_FILE = book_file
+with contextlib.redirect_stdout(io.StringIO()):
+    reddit_automation.check_run(dry_run=True)
+print(json.dumps({'loaded': [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+def run_probe(code, *args):
+    """Run a probe in a fresh interpreter; returns (wall seconds, its JSON output)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code, *args], cwd=here, check=True,
+                            capture_output=True, text=True).stdout
+    return time.perf_counter() - start, json.loads(output.strip().splitlines()[-1])
+
+def startup_benchmark(repeats=5, subreddit_count=7, reddit_latency=0.05, budget_ms=IMPORT_BUDGET_MS):
+    """Cold-start cost: import time of reddit_automation and a full --dry-run health check, each in a fresh interpreter"""
+    import_ms = []
+    loaded = set()
+    for _ in range(repeats):
+        _, result = run_probe(IMPORT_PROBE)
+        import_ms.append(result['import_ms'])
+        loaded.update(result['loaded'])
+
+    check_s = []
+    stub = StubReddit(latency=reddit_latency).start()
+    subreddits = make_subreddits(subreddit_count, stub.base_url)
+    book_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book_summary.md')
+    try:
+        for _ in range(repeats):
+            work_dir = tempfile.mkdtemp(prefix='reddit_startup_')
+            try:
+                elapsed, result = run_probe(FETCH_PROBE, work_dir, json.dumps(subreddits), book_file)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            check_s.append(elapsed)
+            loaded.update(result['loaded'])
+    finally:
+        stub.stop()
+
+    import_ms.sort()
+    check_s.sort()
+    return {
+        'import_p50_ms': round(percentile(import_ms, 50), 1),
+        'import_max_ms': round(import_ms[-1], 1),
+        'import_budget_ms': budget_ms,
+        'dry_run_p50_s': round(percentile(check_s, 50), 3),
+        'dry_run_max_s': round(check_s[-1], 3),
+        'heavy_modules_loaded': sorted(loaded),
+        'ok': percentile(import_ms, 50) <= budget_ms and not loaded
+    }
+
+def parse_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[-1])
+    parser.add_argument('--runs', type=int, default=3, help='simulated cron ticks per scenario')
+    parser.add_argument('--workers', type=parse_list, default=[1, 4, 8], help='comma-separated worker counts')
+    parser.add_argument('--subreddits', type=parse_list, default=[7, 28], help='comma-separated subreddit counts')
+    parser.add_argument('--doc-chars', type=parse_list, default=[0, 2_000_000],
+                        help='comma-separated pre-existing Docs sizes (characters)')
+    parser.add_argument('--openai-latency', type=float, default=0.3, help='seconds per fake completion')
+    parser.add_argument('--reddit-latency', type=float, default=0.05, help='seconds per stub listing request')
+    parser.add_argument('--reddit-throttle', type=float, default=0.0,
+                        help='fraction of stub listing requests answered with 429')
+    parser.add_argument('--openai-invalid-rate', type=float, default=0.0,
+                        help='fraction of fake streamed completions that are not valid JSON')
+    parser.add_argument('--openai-cache-min-tokens', type=int, default=1024,
+                        help='shortest prompt prefix the fake OpenAI client caches')
+    parser.add_argument('--openai-rate', type=float, default=reddit_automation.OPENAI_RATE,
+                        help='OpenAI limiter refill rate (requests/s) after its burst; fresh for every scenario')
+    parser.add_argument('--reddit-rate', type=float, default=reddit_http.REDDIT_RATE,
+                        help='Reddit limiter refill rate (requests/s) after its burst; fresh for every scenario')
+    parser.add_argument('--startup', action='store_true',
+                        help=f'only measure cold start (import budget {IMPORT_BUDGET_MS} ms, dry-run health check); '
+                             f'exits 1 if over budget or if {", ".join(LAZY_MODULES)} get imported')
+    parser.add_argument('--check', action='store_true',
+                        help='only check that bold ranges land on the right lines of a fake Doc (emoji, em dashes, '
+                             '█ bars); exits 1 on any misplaced line')
+    parser.add_argument('--json', help='also write results to this JSON file')
+    parser.add_argument('--verbose', action='store_true', help="show main()'s own output")
+    args = parser.parse_args()
+
+    if args.check:
+        problems = check_bold_offsets()
+        for line, style in problems:
+            print(f"⚠ {style}: {line!r}")
+        print(f"Bold offsets: {'OK' if not problems else f'{len(problems)} misplaced line(s)'}")
+        sys.exit(1 if problems else 0)
+
+    if args.startup:
+        result = startup_benchmark(repeats=max(1, args.runs), subreddit_count=args.subreddits[0],
+                                   reddit_latency=args.reddit_latency)
+        print(f"import reddit_automation  p50 {result['import_p50_ms']:>7.1f} ms  max {result['import_max_ms']:>7.1f} ms  "
+              f"(budget {result['import_budget_ms']} ms)")
+        print(f"--dry-run health check    p50 {result['dry_run_p50_s']:>7.3f} s   max {result['dry_run_max_s']:>7.3f} s  "
+              f"({args.subreddits[0]} subreddits, fresh interpreter)")
+        if result['heavy_modules_loaded']:
+            print(f"⚠ imported eagerly: {', '.join(result['heavy_modules_loaded'])}")
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(result, f, indent=2)
+        sys.exit(0 if result['ok'] else 1)
+
+    results = []
+    for subreddit_count in args.subreddits:
+        for workers in args.workers:
+            for doc_chars in args.doc_chars:
+                name = f"{subreddit_count} subs / {workers} workers / {doc_chars // 1000}k doc"
+                result = run_scenario(name, subreddit_count, workers, args.runs,
+                                      args.openai_latency, args.reddit_latency, doc_chars,
+                                      args.reddit_throttle, args.openai_invalid_rate,
+                                      args.openai_cache_min_tokens, args.openai_rate, args.reddit_rate,
+                                      args.verbose)
+                results.append(result)
+                print(f"{name:<36} run p50 {result['run_p50_s']:>7.2f}s  p95 {result['run_p95_s']:>7.2f}s  "
+                      f"{result['subreddits_per_s']:>6.2f} subs/s  {result['items_per_s']:>6.2f} items/s  "
+                      f"openai {result['openai_calls']:>4} ({result['openai_cached_tokens']}/{result['openai_prompt_tokens']} "
+                      f"tokens cached)  docs get/update {result['docs_gets']}/{result['docs_updates']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == '__main__':
+    main()
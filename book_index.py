@@ -0,0 +1,156 @@
+"""
+Book Context Index
+Chunks the book summary once and retrieves only the passages relevant to a prompt (BM25, no network)
+"""
+
+import math
+import re
+from collections import Counter
+
+# Approximate token budget for book context injected into a single prompt
+BOOK_CONTEXT_TOKENS = 350
+
+# Maximum number of passages injected into a single prompt
+BOOK_CONTEXT_TOP_K = 4
+
+# Book summary sections that carry no insight worth injecting into prompts
+SKIP_SECTIONS = ('Authors',)
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by can could do does for from had has have how i if in into is it
+its just me my not of on or our so than that the their them then there these they this to up us was
+we were what when where which who why will with would you your
+""".split())
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed and plural 's' stripped"""
+    tokens = []
+    for t in re.findall(r"[a-z0-9]+", text.lower()):
+        if t in STOPWORDS:
+            continue
+        if len(t) > 3 and t.endswith('s') and not t.endswith('ss'):
+            t = t[:-1]
+        tokens.append(t)
+    return tokens
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token)"""
+    return (len(text) + 3) // 4
+
+def chunk_markdown(text, max_chars=600, skip_sections=SKIP_SECTIONS):
+    """Split markdown into passages, one per section, each prefixed with its heading
+
+    Sections longer than max_chars are split on line boundaries; sections whose
+    heading is in skip_sections are dropped.
+    """
+    passages = []
+    heading = ''
+    lines = []
+
+    def flush():
+        body = [line for line in lines if line.strip()]
+        if not body or heading in skip_sections:
+            return
+        chunk = []
+        size = 0
+        for line in body:
+            if chunk and size + len(line) > max_chars:
+                passages.append('\n'.join([heading] + chunk if heading else chunk))
+                chunk, size = [], 0
+            chunk.append(line)
+            size += len(line) + 1
+        passages.append('\n'.join([heading] + chunk if heading else chunk))
+
+    for line in text.splitlines():
+        if line.startswith('#'):
+            flush()
+            heading = line.lstrip('#').strip()
+            lines = []
+        else:
+            lines.append(line.rstrip())
+    flush()
+
+    return passages
+
+class BookIndex:
+    """BM25 index over book passages"""
+
+    def __init__(self, passages):
+        self.passages = passages
+        self._term_freqs = [Counter(tokenize(p)) for p in passages]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(passages)) if passages else 0
+
+        doc_freqs = Counter()
+        for tf in self._term_freqs:
+            doc_freqs.update(tf.keys())
+        n = len(passages)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    @classmethod
+    def from_text(cls, text):
+        """Build an index from markdown text"""
+        return cls(chunk_markdown(text))
+
+    def scores(self, query):
+        """BM25 score of every passage against the query"""
+        terms = set(tokenize(query))
+        results = []
+        for tf, length in zip(self._term_freqs, self._lengths):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self._avg_length or 1))
+            for term in terms:
+                f = tf.get(term)
+                if f:
+                    score += self._idf[term] * f * (BM25_K1 + 1) / (f + norm)
+            results.append(score)
+        return results
+
+    def leading(self, token_budget):
+        """Indices of the opening passages that fit in the token budget, in book order"""
+        chosen = []
+        used = 0
+        for i, passage in enumerate(self.passages):
+            cost = estimate_tokens(passage)
+            if used + cost > token_budget:
+                break
+            chosen.append(i)
+            used += cost
+        return chosen
+
+    def select(self, query, token_budget=BOOK_CONTEXT_TOKENS, top_k=BOOK_CONTEXT_TOP_K, exclude=()):
+        """Top-k passages for the query that fit in the token budget, in book order
+
+        Passages whose index is in exclude are never chosen. Falls back to the
+        opening passages when nothing in the book matches.
+        """
+        exclude = set(exclude)
+        candidates = [i for i in range(len(self.passages)) if i not in exclude]
+        scores = self.scores(query)
+        ranked = sorted(
+            (i for i in candidates if scores[i] > 0),
+            key=lambda i: scores[i],
+            reverse=True
+        )
+        if not ranked:
+            ranked = candidates
+
+        chosen = []
+        used = 0
+        for i in ranked:
+            if len(chosen) >= top_k:
+                break
+            cost = estimate_tokens(self.passages[i])
+            if used + cost > token_budget:
+                continue
+            chosen.append(i)
+            used += cost
+
+        return '\n\n'.join(self.passages[i] for i in sorted(chosen))
@@ -0,0 +1,119 @@
+"""
+LLM Completion Cache
+Content-addressed SQLite cache for chat completions with TTL and size-bounded LRU eviction
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = "/home/ubuntu/completion_cache.db"
+
+# Entries older than this are treated as misses and removed
+CACHE_TTL = 7 * 24 * 3600
+
+# Least-recently-used entries are evicted once the cache grows past this size
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+def completion_key(model, messages, temperature, **params):
+    """Hash of everything that determines a completion's output"""
+    payload = json.dumps({
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+        'params': params
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class CompletionCache:
+    """Disk-backed completion cache with hit/miss counters"""
+
+    def __init__(self, path=None, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.path = path = path or CACHE_FILE
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One shared connection; every access goes through self._lock
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON completions (last_access)")
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        now = time.time()
+        with self._lock, self._conn as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(value)
+
+    def put(self, key, value):
+        """Store a value and evict least-recently-used entries past the size bound"""
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._conn as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute("SELECT key, size FROM completions ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Hit/miss counters plus current entry count and size"""
+        with self._lock, self._conn as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': entries,
+            'bytes': size
+        }
@@ -0,0 +1,95 @@
+"""
+Incremental JSON Item Parser
+Surfaces each object of a streamed JSON array as soon as it is complete, and flags streams that cannot be valid JSON
+"""
+
+import json
+
+class InvalidJSONStream(ValueError):
+    """The streamed text can no longer turn into valid JSON"""
+
+class JSONItemStream:
+    """Incremental parser for completions shaped like [{...}, ...] or {"key": [{...}, ...]}
+
+    feed() returns the objects that became complete with each chunk: any
+    object whose direct parent is an array. finish() returns the whole
+    document's single top-level object when it held no such items (a bare
+    {"title": ..., "content": ...}).
+    """
+
+    def __init__(self):
+        self._text = []
+        self._length = 0
+        self._stack = []
+        self._item_start = None
+        self._in_string = False
+        self._escape = False
+        self._done = False
+        self.items = 0
+
+    def feed(self, chunk):
+        """Consume a chunk of text; returns newly completed items, raises InvalidJSONStream"""
+        completed = []
+        base = self._length
+        self._text.append(chunk)
+        self._length += len(chunk)
+
+        for offset, char in enumerate(chunk):
+            position = base + offset
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char.isspace():
+                continue
+
+            if self._done:
+                raise InvalidJSONStream(f"unexpected {char!r} after the end of the JSON document")
+
+            if not self._stack and char not in '{[':
+                raise InvalidJSONStream(f"stream starts with {char!r}, not a JSON object or array")
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if char == '{' and self._stack and self._stack[-1] == '[' and self._item_start is None:
+                    self._item_start = (position, len(self._stack))
+                self._stack.append(char)
+            elif char in '}]':
+                expected = '{' if char == '}' else '['
+                if not self._stack or self._stack[-1] != expected:
+                    raise InvalidJSONStream(f"unbalanced {char!r}")
+                self._stack.pop()
+                if char == '}' and self._item_start and self._item_start[1] == len(self._stack):
+                    completed.append(self._parse(self._item_start[0], position + 1))
+                    self._item_start = None
+                if not self._stack:
+                    self._done = True
+
+        self.items += len(completed)
+        return completed
+
+    def _parse(self, start, end):
+        text = ''.join(self._text)
+        try:
+            return json.loads(text[start:end])
+        except ValueError as e:
+            raise InvalidJSONStream(f"item is not valid JSON: {e}")
+
+    def finish(self):
+        """Validate the end of the stream; returns the bare top-level object if no items were found"""
+        if not self._done:
+            raise InvalidJSONStream("stream ended before the JSON document was complete")
+        if self.items:
+            return None
+        try:
+            document = json.loads(''.join(self._text))
+        except ValueError as e:
+            raise InvalidJSONStream(f"document is not valid JSON: {e}")
+        return document if isinstance(document, dict) else None
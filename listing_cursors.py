@@ -0,0 +1,78 @@
+"""
+Listing Cursors
+Newest post seen per subreddit, so each run pages /new only back to where the last run stopped
+"""
+
+import json
+import os
+import threading
+
+CURSORS_FILE = "/home/ubuntu/listing_cursors.json"
+
+# Runs in a row a selected post may go unanswered (holding its subreddit's
+# cursor) before it is given up on and the cursor moves past it
+MAX_POST_ATTEMPTS = 3
+
+class ListingCursors:
+    """{subreddit: {'fullname', 'created_utc', 'failed'}} backed by a small JSON file, rewritten atomically on change
+
+    'failed' counts the runs each post held back by the cursor has gone
+    unanswered; it is dropped whenever the cursor moves.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CURSORS_FILE
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as f:
+                self._cursors = json.load(f)
+        except (OSError, ValueError):
+            self._cursors = {}
+
+    def __len__(self):
+        return len(self._cursors)
+
+    def get(self, subreddit_name):
+        """Cursor recorded for the subreddit, or None (it has no 'fullname' until it first moves)"""
+        with self._lock:
+            return self._cursors.get(subreddit_name)
+
+    def advance(self, subreddit_name, newest):
+        """Move the subreddit's cursor to `newest` if it is newer; returns True if it moved"""
+        if not newest or not newest.get('fullname'):
+            return False
+
+        with self._lock:
+            current = self._cursors.get(subreddit_name)
+            if current and (current.get('created_utc') or 0) > (newest.get('created_utc') or 0):
+                return False
+            if current == newest:
+                return False
+            self._cursors[subreddit_name] = newest
+            self._save()
+            return True
+
+    def record_failures(self, subreddit_name, post_ids):
+        """Count one more unanswered run for each post; returns {post_id: runs unanswered}
+
+        Posts not in post_ids were answered (or dropped out of the selection)
+        and lose their count.
+        """
+        with self._lock:
+            cursor = dict(self._cursors.get(subreddit_name) or {})
+            failed = cursor.get('failed') or {}
+            attempts = {post_id: failed.get(post_id, 0) + 1 for post_id in post_ids}
+            cursor['failed'] = attempts
+            self._cursors[subreddit_name] = cursor
+            self._save()
+            return attempts
+
+    def _save(self):
+        """Rewrite the cursors file atomically (call with the lock held)"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._cursors, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,190 @@
+"""
+Master File Index
+Sidecar offset index of the blocks in all_questions.txt / all_responses.txt, so any block is read straight from an mmap
+"""
+
+import json
+import mmap
+import os
+import re
+
+# The sidecar of a master file is <master file><INDEX_SUFFIX>, one JSON line per block:
+# {"offset", "length", "subreddit", "generated_at", "urls"} (byte offsets into the master file)
+INDEX_SUFFIX = '.idx'
+
+# Start of every subreddit block, as written by reddit_automation.format_header
+BAR = '█' * 80
+BLOCK_START = re.compile(re.escape(f"\n\n{BAR}\n{BAR}\nSUBREDDIT: r/".encode('utf-8')))
+HEADER = re.compile(rb"SUBREDDIT: r/(\S+)\nGENERATED: ([^\n]*)\n")
+POST_URL = re.compile(rb"^URL: (\S+)$", re.MULTILINE)
+
+# How far back from the end of a sidecar to look for its last entry
+TAIL_BYTES = 64 * 1024
+
+def index_path(path):
+    """Sidecar index of a master file"""
+    return f"{path}{INDEX_SUFFIX}"
+
+def scan_blocks(data, start=0, end=None, base_offset=0):
+    """Index entries of the blocks in data[start:end] (bytes or mmap), offsets shifted by base_offset
+
+    A block runs from its header to the next header or the end of the range;
+    text before the first header is not part of any block.
+    """
+    end = len(data) if end is None else end
+    starts = [match.start() for match in BLOCK_START.finditer(data, start, end)]
+    entries = []
+    for block_start, block_end in zip(starts, starts[1:] + [end]):
+        block = data[block_start:block_end]
+        header = HEADER.search(block)
+        entries.append({
+            'offset': base_offset + block_start,
+            'length': block_end - block_start,
+            'subreddit': header.group(1).decode('utf-8') if header else None,
+            'generated_at': header.group(2).decode('utf-8') if header else None,
+            'urls': [url.decode('utf-8') for url in POST_URL.findall(block)]
+        })
+    return entries
+
+def append_entries(path, entries):
+    """Append entries to a sidecar index"""
+    if not entries:
+        return
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(''.join(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+                        for entry in entries))
+
+def indexed_end(path):
+    """Byte offset in the master file up to which a sidecar index is complete (0 if missing)
+
+    Reads only the tail of the sidecar. A torn last line from a crashed run
+    is cut off, so the next append starts on a fresh line.
+    """
+    try:
+        f = open(path, 'rb+')
+    except FileNotFoundError:
+        return 0
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        start = max(0, size - TAIL_BYTES)
+        f.seek(start)
+        tail = f.read()
+        complete = tail.rfind(b'\n') + 1
+        if start + complete < size:
+            f.truncate(start + complete)
+        for line in reversed(tail[:complete].splitlines()):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            return entry['offset'] + entry['length']
+    return 0
+
+def sync_index(path, sidecar=None):
+    """Index whatever the master file has beyond its sidecar; returns the number of blocks added
+
+    Costs one look at the sidecar's tail when it is already up to date. A
+    master file with no sidecar yet is scanned once through an mmap, and a
+    sidecar pointing past the end of its master (file truncated or replaced)
+    is rebuilt from scratch.
+    """
+    sidecar = sidecar or index_path(path)
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        size = 0
+    end = indexed_end(sidecar)
+    if end == size:
+        return 0
+    if end > size:
+        open(sidecar, 'w').close()
+        end = 0
+        if not size:
+            return 0
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        entries = scan_blocks(data, end, size)
+    append_entries(sidecar, entries)
+    return len(entries)
+
+def load_entries(path):
+    """Entries of a sidecar index in file order, skipping torn lines and entries overlapping earlier ones"""
+    entries = []
+    end = 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry['offset'] < end:
+                    continue
+                entries.append(entry)
+                end = entry['offset'] + entry['length']
+    except FileNotFoundError:
+        pass
+    return entries
+
+class MasterFile:
+    """Read-only view of a master file: lookups go to the sidecar index, block reads to an mmap
+
+    The index is synced with the master file when opened; blocks appended
+    afterwards are not visible until the file is opened again.
+    """
+
+    def __init__(self, path, sidecar=None):
+        self.path = path
+        self.sidecar = sidecar or index_path(path)
+        sync_index(path, self.sidecar)
+        self.entries = load_entries(self.sidecar)
+        self._by_url = {}
+        for entry in self.entries:
+            for url in entry['urls']:
+                self._by_url.setdefault(url, []).append(entry)
+
+        self._file = None
+        self._data = None
+        if self.entries:
+            self._file = open(path, 'rb')
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def blocks(self, subreddit=None, since=None, until=None):
+        """Entries of matching blocks, oldest first
+
+        since/until are timestamps ('YYYY-MM-DD' or longer) compared against
+        the block's GENERATED time. Answered from the index alone.
+        """
+        return [
+            entry for entry in self.entries
+            if (not subreddit or entry['subreddit'] == subreddit)
+            and (not since or (entry['generated_at'] or '') >= since)
+            and (not until or (entry['generated_at'] or '') <= until)
+        ]
+
+    def lookup_url(self, url):
+        """Entries of the blocks that answered the post at url (empty if it never was)"""
+        return list(self._by_url.get(url, ()))
+
+    def read(self, entry):
+        """Text of one block"""
+        return self._data[entry['offset']:entry['offset'] + entry['length']].decode('utf-8')
+
+    def tail(self, count=1):
+        """Text of the last count blocks"""
+        return [self.read(entry) for entry in self.entries[-count:]] if count > 0 else []
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._file.close()
+            self._data = self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,144 @@
+"""
+Run Metrics
+Per-stage wall time, counters and OpenAI token usage, emitted as a JSON summary and an optional Prometheus textfile
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = "/home/ubuntu/run_metrics"
+
+# Optional Prometheus node_exporter textfile (e.g. /var/lib/node_exporter/reddit_automation.prom)
+METRICS_PROM_FILE = os.environ.get('METRICS_PROM_FILE')
+
+PROM_PREFIX = 'reddit_automation'
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted, non-empty list"""
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+class Metrics:
+    """Thread-safe collector of stage timings, counters and token usage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear everything and restart the run clock"""
+        with self._lock:
+            self._started = time.time()
+            self._start_perf = time.perf_counter()
+            self._stages = {}
+            self._counters = {}
+            self._tokens = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one occurrence of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Record one occurrence of a stage that took `seconds`"""
+        with self._lock:
+            self._stages.setdefault(name, []).append(seconds)
+
+    def increment(self, name, amount=1):
+        """Bump a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def record_usage(self, stage, usage):
+        """Add an OpenAI `usage` dict to a stage's token totals
+
+        Counts nested in *_details are kept apart per parent, prefixed with its
+        name: prompt_tokens_details.cached_tokens becomes prompt_cached_tokens,
+        completion_tokens_details.audio_tokens completion_audio_tokens.
+        """
+        if not usage:
+            return
+        with self._lock:
+            totals = self._tokens.setdefault(stage, {})
+            for key, value in usage.items():
+                if isinstance(value, dict):
+                    prefix = key.removesuffix('_details').removesuffix('_tokens')
+                    for sub_key, sub_value in value.items():
+                        if isinstance(sub_value, (int, float)):
+                            name = f"{prefix}_{sub_key}"
+                            totals[name] = totals.get(name, 0) + sub_value
+                elif isinstance(value, (int, float)):
+                    totals[key] = totals.get(key, 0) + value
+
+    def summary(self):
+        """Machine-readable snapshot of the run so far"""
+        with self._lock:
+            stages = {}
+            for name, samples in self._stages.items():
+                ordered = sorted(samples)
+                total = sum(ordered)
+                stages[name] = {
+                    'count': len(ordered),
+                    'total_s': round(total, 4),
+                    'mean_s': round(total / len(ordered), 4),
+                    'p50_s': round(percentile(ordered, 50), 4),
+                    'p95_s': round(percentile(ordered, 95), 4),
+                    'max_s': round(ordered[-1], 4)
+                }
+            return {
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self._started)),
+                'wall_s': round(time.perf_counter() - self._start_perf, 4),
+                'stages': stages,
+                'counters': dict(self._counters),
+                'tokens': {stage: dict(totals) for stage, totals in self._tokens.items()}
+            }
+
+    def write_json(self, path):
+        """Write the summary as JSON"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_prometheus(self, path):
+        """Write the summary in Prometheus textfile-collector format (atomically)"""
+        summary = self.summary()
+        lines = [
+            f"# TYPE {PROM_PREFIX}_run_wall_seconds gauge",
+            f"{PROM_PREFIX}_run_wall_seconds {summary['wall_s']}",
+            f"# TYPE {PROM_PREFIX}_stage_seconds_total gauge",
+        ]
+        for name, stats in sorted(summary['stages'].items()):
+            lines.append(f'{PROM_PREFIX}_stage_seconds_total{{stage="{name}"}} {stats["total_s"]}')
+        lines.append(f"# TYPE {PROM_PREFIX}_stage_calls gauge")
+        for name, stats in sorted(summary['stages'].items()):
+            lines.append(f'{PROM_PREFIX}_stage_calls{{stage="{name}"}} {stats["count"]}')
+        lines.append(f"# TYPE {PROM_PREFIX}_stage_max_seconds gauge")
+        for name, stats in sorted(summary['stages'].items()):
+            lines.append(f'{PROM_PREFIX}_stage_max_seconds{{stage="{name}"}} {stats["max_s"]}')
+        lines.append(f"# TYPE {PROM_PREFIX}_events gauge")
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f'{PROM_PREFIX}_events{{event="{name}"}} {value}')
+        lines.append(f"# TYPE {PROM_PREFIX}_tokens gauge")
+        for stage, totals in sorted(summary['tokens'].items()):
+            for kind, value in sorted(totals.items()):
+                lines.append(f'{PROM_PREFIX}_tokens{{stage="{stage}",kind="{kind}"}} {value}')
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+# Process-wide collector used by all modules
+METRICS = Metrics()
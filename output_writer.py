@@ -0,0 +1,127 @@
+"""
+Streaming Output Writer
+Fans each formatted subreddit block out to the per-run file, the master file and Google Docs as soon as it is ready
+"""
+
+import os
+
+from master_index import append_entries, index_path, scan_blocks, sync_index
+from metrics import METRICS
+
+# Write buffer for output files; each block is flushed once complete
+FILE_BUFFER_SIZE = 64 * 1024
+
+class FileSink:
+    """Buffered text file sink, flushed after every block so partial runs survive a crash"""
+
+    # A failed write to this sink means the block is not safely on disk (see BlockWriter.write)
+    durable = True
+
+    def __init__(self, path, mode='a'):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, mode, buffering=FILE_BUFFER_SIZE)
+
+    def write(self, block):
+        with METRICS.stage('file_write'):
+            self._file.write(block)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class IndexedFileSink(FileSink):
+    """FileSink for a master file that also appends each block's offsets to its sidecar index
+
+    The index is first brought up to date with anything the master file
+    gained without it (see master_index.sync_index).
+    """
+
+    def __init__(self, path):
+        super().__init__(path, 'a')
+        self.index_path = index_path(path)
+        with METRICS.stage('index_write'):
+            sync_index(path, self.index_path)
+
+    def write(self, block):
+        offset = os.fstat(self._file.fileno()).st_size
+        super().write(block)
+        data = block.encode('utf-8')
+        # Written in another encoding, the block is left for the next sync to scan
+        if os.fstat(self._file.fileno()).st_size - offset != len(data):
+            return
+        with METRICS.stage('index_write'):
+            append_entries(self.index_path, scan_blocks(data, base_offset=offset))
+
+class DocsSink:
+    """Appends each block to the current segment of a Google Doc, building the Docs service on first use
+
+    If the service cannot be built, later blocks are counted as failed without retrying.
+    """
+
+    durable = False
+
+    def __init__(self, doc_id, service=None):
+        self.doc_id = doc_id
+        self.service = service
+        self.appended = 0
+        self.failed = 0
+
+    def write(self, block):
+        from update_and_format_docs import append_to_document, get_docs_service
+
+        if self.service is None:
+            try:
+                self.service = get_docs_service()
+            except Exception as e:
+                print(f"   ⚠ Could not connect to Google Docs: {str(e)}")
+                self.service = False
+        if self.service is False:
+            self.failed += 1
+            return
+
+        # append_and_format adds its own blank-line separator
+        ok = append_to_document(self.service, self.doc_id, block.lstrip('\n'))
+
+        if ok:
+            self.appended += 1
+        else:
+            self.failed += 1
+
+    def close(self):
+        pass
+
+class BlockWriter:
+    """Writes each block to every sink; a failing sink is reported and does not stop the others"""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self.blocks = 0
+
+    def write(self, block):
+        """Write block to every sink; returns False if a durable (file) sink failed"""
+        self.blocks += 1
+        ok = True
+        for sink in self.sinks:
+            try:
+                sink.write(block)
+            except Exception as e:
+                print(f"   ⚠ Could not write to {type(sink).__name__}: {str(e)}")
+                if sink.durable:
+                    ok = False
+        return ok
+
+    def close(self):
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"   ⚠ Could not close {type(sink).__name__}: {str(e)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,55 @@
+"""
+Post Ranking
+Filters and ranks fetched posts locally so completions go to the posts most worth answering
+"""
+
+import math
+
+from book_index import tokenize
+
+# Weights of the relevance components
+FOCUS_WEIGHT = 2.0
+BOOK_WEIGHT = 1.0
+ENGAGEMENT_WEIGHT = 0.1
+
+# Self-text Reddit leaves behind for moderated or deleted posts
+REMOVED_SELFTEXT = ('[removed]', '[deleted]')
+
+# Characters of a post body used for scoring
+SCORED_CHARS = 2000
+
+def is_candidate(post):
+    """Worth answering at all: not a stickied mod post, and a text post with a real body"""
+    if post.get('stickied'):
+        return False
+    if post.get('is_self') is False:
+        return False
+    selftext = post.get('selftext', '').strip()
+    return bool(selftext) and selftext not in REMOVED_SELFTEXT
+
+def relevance(post, focus_terms, book_index):
+    """Lexical fit of a post to the subreddit focus and the book, plus a small engagement prior
+
+    focus: share of the focus terms the post mentions (0-1).
+    book: best BM25 match against a book passage, normalised by query size.
+    engagement: log of the comment count (an active thread gets read).
+    """
+    terms = set(tokenize(f"{post.get('title', '')} {post.get('selftext', '')[:SCORED_CHARS]}"))
+    if not terms:
+        return 0.0
+
+    focus = len(terms & focus_terms) / len(focus_terms) if focus_terms else 0.0
+    book = max(book_index.scores(' '.join(terms)), default=0.0) / math.sqrt(len(terms))
+    engagement = math.log1p(max(0, post.get('num_comments') or 0))
+
+    return FOCUS_WEIGHT * focus + BOOK_WEIGHT * book + ENGAGEMENT_WEIGHT * engagement
+
+def rank_posts(posts, config, book_index, top_k=None):
+    """Candidate posts, best first (ties keep listing order), each tagged with its 'relevance'"""
+    focus_terms = set(tokenize(config.get('focus', '')))
+    candidates = [post for post in posts if is_candidate(post)]
+    for post in candidates:
+        post['relevance'] = round(relevance(post, focus_terms, book_index), 4)
+
+    ranked = sorted(candidates, key=lambda post: post['relevance'], reverse=True)
+    return ranked[:top_k] if top_k is not None else ranked
@@ -0,0 +1,147 @@
+"""
+Prompt Templates
+Chat messages laid out for OpenAI prompt caching: static instructions and book first, then the subreddit, then the posts
+"""
+
+from book_index import BOOK_CONTEXT_TOKENS, estimate_tokens
+
+# OpenAI caches the longest previously seen prompt prefix (from 1024 tokens, in
+# 128-token steps), so every prompt is assembled from the most to the least
+# stable part:
+#   1. system message: SYSTEM_PROMPT (+ the book prefix), identical for every call
+#   2. task instructions, identical for every call of one kind
+#   3. subreddit block, identical for every call about one subreddit
+#   4. the variable tail: counts, posts and passages retrieved for them
+# The book only moves into the system message when that makes the shared
+# prefix long enough to be cached; otherwise each prompt keeps its own
+# budgeted passages (book_index.select) in the tail.
+
+# OpenAI does not cache prompts shorter than this
+MIN_CACHED_PREFIX_TOKENS = 1024
+
+# Most book tokens (opening passages, in book order) the system message may carry.
+# Passages past this budget are retrieved per prompt into the tail instead.
+BOOK_PREFIX_TOKENS = 2000
+
+# Characters of a post body included in a prompt
+POST_CHARS = 500
+
+SYSTEM_PROMPT = """You are a leadership expert taking part in Reddit communities about leadership, management and work.
+
+Everything you write:
+- Matches the tone and focus of the subreddit it is for
+- Provides genuine value, context and concrete examples
+- Draws on the book insights it is given without ever mentioning the book
+- Is conversational and empathetic, and never self-promotional"""
+
+QUESTION_INSTRUCTIONS = """TASK: Write thought-provoking questions to post as new discussions in the subreddit below.
+
+For each question, provide:
+1. A provocative, attention-grabbing title (question format)
+2. A detailed post body (150-250 words) that:
+   - Provides context and examples
+   - Draws on insights from the book (without mentioning it)
+   - Invites discussion and different perspectives
+   - Matches the subreddit's tone and focus
+
+IMPORTANT: Return ONLY valid JSON, no markdown, no other text. Format:
+[{"title": "Question title?", "content": "Post body text..."}]"""
+
+RESPONSE_INSTRUCTIONS = """TASK: Respond to the post below, from the subreddit below.
+
+Write a helpful, thoughtful response (150-300 words) that:
+- Matches the subreddit's tone
+- Provides genuine value and insights
+- Draws on concepts from the book (without mentioning it)
+- Is conversational and empathetic
+- Avoids self-promotion
+
+Return only the response text, no JSON or formatting."""
+
+BATCH_RESPONSE_INSTRUCTIONS = """TASK: Respond to each of the posts below, all from the subreddit below.
+
+For EACH post, write a helpful, thoughtful response (150-300 words) that:
+- Matches the subreddit's tone
+- Provides genuine value and insights
+- Draws on concepts from the book (without mentioning it)
+- Is conversational and empathetic
+- Avoids self-promotion
+
+IMPORTANT: Return ONLY valid JSON, no markdown, no other text. Format:
+{"responses": [{"post": 1, "response": "Response text..."}]}"""
+
+def book_prefix(book_index):
+    """Indices of the passages that go into the system message (empty if they can't make it cacheable)
+
+    The shortest shared prefix (system message plus the shortest task
+    instructions) must reach MIN_CACHED_PREFIX_TOKENS with them; a prefix
+    that is never cached would only make every prompt longer.
+    """
+    passages = book_index.leading(BOOK_PREFIX_TOKENS)
+    book = '\n\n'.join(book_index.passages[i] for i in passages)
+    instructions = min(QUESTION_INSTRUCTIONS, RESPONSE_INSTRUCTIONS, BATCH_RESPONSE_INSTRUCTIONS, key=len)
+    if estimate_tokens(f"{SYSTEM_PROMPT}\n\nBOOK INSIGHTS:\n{book}{instructions}") < MIN_CACHED_PREFIX_TOKENS:
+        return []
+    return passages
+
+def system_message(book_index):
+    """The system message shared by every prompt: SYSTEM_PROMPT and the book prefix, if any"""
+    passages = book_prefix(book_index)
+    if not passages:
+        return {"role": "system", "content": SYSTEM_PROMPT}
+    book = '\n\n'.join(book_index.passages[i] for i in passages)
+    return {"role": "system", "content": f"{SYSTEM_PROMPT}\n\nBOOK INSIGHTS:\n{book}"}
+
+def subreddit_block(subreddit_name, config):
+    """Description of a subreddit, shared by every prompt about it"""
+    return (f"SUBREDDIT: r/{subreddit_name}\n"
+            f"- Tone: {config['tone']}\n"
+            f"- Focus: {config['focus']}")
+
+def book_tail(book_index, query):
+    """Passages relevant to the query, within BOOK_CONTEXT_TOKENS, that are not in the book prefix ('' if none)"""
+    prefix = book_prefix(book_index)
+    context = book_index.select(query, token_budget=BOOK_CONTEXT_TOKENS, exclude=prefix)
+    if not context:
+        return ''
+    return f"\n\n{'MORE BOOK INSIGHTS' if prefix else 'BOOK INSIGHTS'}:\n{context}"
+
+def render(book_index, instructions, subreddit_name, config, tail):
+    """Chat messages for one prompt, most stable part first"""
+    return [
+        system_message(book_index),
+        {"role": "user", "content": f"{instructions}\n\n{subreddit_block(subreddit_name, config)}\n\n{tail}"}
+    ]
+
+def shared_prefix_tokens(book_index, subreddit_name, config, instructions=QUESTION_INSTRUCTIONS):
+    """Estimated tokens of the prefix shared by every prompt of one kind about one subreddit"""
+    return estimate_tokens(system_message(book_index)['content'] + instructions +
+                           subreddit_block(subreddit_name, config))
+
+def question_messages(subreddit_name, config, book_index, num_questions, avoid_titles=()):
+    """Chat messages asking for num_questions discussion questions as JSON, steering away from avoid_titles"""
+    tail = f"Generate {num_questions} question(s) for r/{subreddit_name}."
+    if avoid_titles:
+        tail += "\n\nThese questions were already asked; do NOT repeat or paraphrase them:\n" + \
+                ''.join(f"- {title}\n" for title in avoid_titles)
+    tail += book_tail(book_index, f"{config['focus']} {config['tone']}")
+    return render(book_index, QUESTION_INSTRUCTIONS, subreddit_name, config, tail)
+
+def response_messages(post, config, book_index):
+    """Chat messages asking for a plain-text response to one post"""
+    body = post['selftext'][:POST_CHARS]
+    tail = f"POST:\nTitle: {post['title']}\nContent: {body}"
+    tail += book_tail(book_index, f"{post['title']} {body} {config['focus']}")
+    return render(book_index, RESPONSE_INSTRUCTIONS, post['subreddit'], config, tail)
+
+def batch_response_messages(posts, config, book_index):
+    """Chat messages asking for JSON responses to several posts of one subreddit"""
+    tail = f"POSTS ({len(posts)}):\n\n" + "\n\n".join(
+        f"[POST {i}]\nTitle: {post['title']}\nContent: {post['selftext'][:POST_CHARS]}"
+        for i, post in enumerate(posts, 1)
+    )
+    tail += book_tail(
+        book_index,
+        ' '.join(f"{post['title']} {post['selftext'][:POST_CHARS]}" for post in posts) + ' ' + config['focus']
+    )
+    return render(book_index, BATCH_RESPONSE_INSTRUCTIONS, posts[0]['subreddit'], config, tail)
@@ -0,0 +1,185 @@
+"""
+Question Similarity Index
+MinHash/LSH index over past generated questions, so near-duplicates can be caught before they are published
+"""
+
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from book_index import tokenize
+
+INDEX_FILE = "/home/ubuntu/question_index.bin"
+
+# MinHash signature length, split into LSH bands of BAND_ROWS values each.
+# 32 bands of 3 rows make any pair above ~0.3 Jaccard a candidate; candidates
+# are then checked against the full signature.
+NUM_PERM = 96
+BAND_ROWS = 3
+NUM_BANDS = NUM_PERM // BAND_ROWS
+
+# Estimated Jaccard similarity (word bigrams of title + body) at which a question is a near-duplicate
+DUPLICATE_THRESHOLD = 0.5
+
+# Fixed seed: signatures are persisted, so the hash family must never change
+_rng = np.random.default_rng(20240601)
+_HASH_A = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_HASH_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 2 ** 63, size=BAND_ROWS, dtype=np.uint64) | np.uint64(1)
+_BAND_SALT = _rng.integers(0, 2 ** 63, size=NUM_BANDS, dtype=np.uint64)
+
+def shingles(text):
+    """Word bigrams of the normalised text (single words for very short texts)"""
+    words = tokenize(text)
+    if len(words) < 2:
+        return set(words)
+    return {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+def signature(text):
+    """MinHash signature (NUM_PERM uint32 values) of a text"""
+    values = np.fromiter(
+        (zlib.crc32(s.encode('utf-8')) for s in shingles(text)),
+        dtype=np.uint64
+    )
+    if not values.size:
+        return np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    # Multiply-shift hashing: the high 32 bits of a*x + b (mod 2**64), one row per permutation
+    with np.errstate(over='ignore'):
+        hashed = (_HASH_A[:, None] * values[None, :] + _HASH_B[:, None]) >> np.uint64(32)
+    return hashed.min(axis=1).astype(np.uint32)
+
+def band_keys(signatures):
+    """LSH bucket keys (N, NUM_BANDS) of a (N, NUM_PERM) signature array, distinct across bands"""
+    rows = signatures.reshape(len(signatures), NUM_BANDS, BAND_ROWS).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return (rows * _BAND_MIX).sum(axis=2, dtype=np.uint64) + _BAND_SALT
+
+def question_text(question):
+    """Indexed text of a question (or run log question record)"""
+    return f"{question.get('title', '')}\n{question.get('content', '')}"
+
+class QuestionIndex:
+    """Signatures of past questions in an append-only binary file, searched with LSH banding
+
+    A lookup lists the rows sharing at least one band bucket with the query
+    and estimates similarity for those rows only, so its cost does not grow
+    with the size of the history. Buckets of the rows loaded from disk are a
+    sorted key array (searched with searchsorted, built with one argsort);
+    rows added since live in a dict. Claimed questions only reach the file
+    once they are committed (i.e. published); released claims stop matching.
+    Safe to share across threads.
+    """
+
+    def __init__(self, path=None, threshold=DUPLICATE_THRESHOLD):
+        self.path = path or INDEX_FILE
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._size = 0
+        self._signatures = np.empty((0, NUM_PERM), dtype=np.uint32)
+        self._sorted_keys = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.intp)
+        self._buckets = {}
+        self._pending = {}
+        self._released = set()
+
+        try:
+            data = np.fromfile(self.path, dtype=np.uint32)
+        except (FileNotFoundError, ValueError):
+            data = np.empty(0, dtype=np.uint32)
+        # Drop a torn trailing record from a crashed run
+        data = data[:len(data) - len(data) % NUM_PERM]
+        if data.size:
+            signatures = data.reshape(-1, NUM_PERM)
+            keys = band_keys(signatures).ravel()
+            order = np.argsort(keys, kind='stable')
+            self._sorted_keys = keys[order]
+            self._sorted_rows = order // NUM_BANDS
+            self._append(signatures, index=False)
+
+    def __len__(self):
+        return self._size
+
+    def _append(self, signatures, index=True):
+        """Add rows in memory, growing the arrays geometrically, and bucket them unless index=False"""
+        needed = self._size + len(signatures)
+        if needed > len(self._signatures):
+            capacity = max(needed, 2 * len(self._signatures), 1024)
+            grown = np.empty((capacity, NUM_PERM), dtype=np.uint32)
+            grown[:self._size] = self._signatures[:self._size]
+            self._signatures = grown
+        self._signatures[self._size:needed] = signatures
+        if index:
+            for row, keys in enumerate(band_keys(signatures).tolist(), start=self._size):
+                for key in keys:
+                    self._buckets.setdefault(key, []).append(row)
+        self._size = needed
+
+    def _best_match(self, sig):
+        keys = band_keys(sig[None, :])[0]
+        left = np.searchsorted(self._sorted_keys, keys, side='left')
+        right = np.searchsorted(self._sorted_keys, keys, side='right')
+        candidates = set()
+        for start, end in zip(left.tolist(), right.tolist()):
+            if end > start:
+                candidates.update(self._sorted_rows[start:end].tolist())
+        for key in keys.tolist():
+            candidates.update(self._buckets.get(key, ()))
+        candidates -= self._released
+        if not candidates:
+            return 0.0
+        rows = self._signatures[np.fromiter(candidates, dtype=np.intp, count=len(candidates))]
+        return float((rows == sig).mean(axis=1).max())
+
+    def similarity(self, text):
+        """Highest estimated Jaccard similarity between text and any indexed question"""
+        sig = signature(text)
+        with self._lock:
+            return self._best_match(sig)
+
+    def add_many(self, texts):
+        """Index texts unconditionally and persist them"""
+        signatures = np.array([signature(text) for text in texts], dtype=np.uint32).reshape(-1, NUM_PERM)
+        if not len(signatures):
+            return
+        with self._lock:
+            self._persist(signatures)
+            self._append(signatures)
+
+    def claim(self, text):
+        """Index text in memory unless it near-duplicates an indexed or claimed question
+
+        Returns (added, similarity). Checking and adding happen under one lock,
+        so two threads cannot both claim the same question. The claim is kept
+        on disk only once committed; see commit() and release().
+        """
+        sig = signature(text)
+        with self._lock:
+            similarity = self._best_match(sig)
+            if similarity >= self.threshold:
+                return False, similarity
+            self._pending[text] = self._size
+            self._append(sig[None, :])
+            return True, similarity
+
+    def commit(self, texts):
+        """Persist the claims of texts (questions that have been published)"""
+        with self._lock:
+            rows = [self._pending.pop(text) for text in texts if text in self._pending]
+            if rows:
+                self._persist(self._signatures[rows])
+
+    def release(self, texts):
+        """Withdraw the claims of texts (questions that were never published)"""
+        with self._lock:
+            for text in texts:
+                if text in self._pending:
+                    self._released.add(self._pending.pop(text))
+
+    def _persist(self, signatures):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(np.ascontiguousarray(signatures, dtype=np.uint32).tobytes())
@@ -0,0 +1,182 @@
+"""
+Rate Limiting and Retries
+Shared token-bucket limiters that adapt to Retry-After / x-ratelimit-* headers, plus jittered exponential backoff under a per-run deadline
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from metrics import METRICS
+
+# Whole-run budget for waiting and retrying; calls that would overrun it fail fast
+RUN_DEADLINE_SECONDS = float(os.environ.get('RUN_DEADLINE_SECONDS', 900))
+
+# Backoff schedule for retryable failures
+MAX_ATTEMPTS = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+_run_deadline = None
+
+class DeadlineExceeded(Exception):
+    """Waiting for a rate limit or retry would overrun the run deadline"""
+
+def start_run_deadline(seconds=None):
+    """Start the per-run deadline clock (RUN_DEADLINE_SECONDS by default)"""
+    global _run_deadline
+    _run_deadline = time.monotonic() + (RUN_DEADLINE_SECONDS if seconds is None else seconds)
+
+def run_deadline():
+    """Monotonic time at which the current run must finish, or None"""
+    return _run_deadline
+
+def parse_duration(value):
+    """Seconds from '20', '1.5', '20ms', '6m0s' or '1h2m3.5s'; None if unparseable"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts:
+        return None
+    scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+def retry_after_seconds(headers):
+    """Server-requested wait from retry-after-ms / Retry-After (seconds or HTTP date)"""
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        seconds = parse_duration(value)
+        return seconds / 1000 if seconds is not None else None
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def quota_from_headers(headers):
+    """(remaining requests, seconds until reset) from OpenAI or Reddit rate-limit headers"""
+    if not headers:
+        return None, None
+    for remaining_key, reset_key in (
+        ('x-ratelimit-remaining-requests', 'x-ratelimit-reset-requests'),   # OpenAI
+        ('x-ratelimit-remaining', 'x-ratelimit-reset'),                     # Reddit
+    ):
+        remaining = headers.get(remaining_key)
+        if remaining is not None:
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                return None, None
+            return remaining, parse_duration(headers.get(reset_key))
+    return None, None
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate follows the server's advertised quota"""
+
+    def __init__(self, name, rate, capacity):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, deadline=None):
+        """Block until a request may be sent; raises DeadlineExceeded instead of overrunning deadline"""
+        if deadline is None:
+            deadline = run_deadline()
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                wait = max(self._paused_until - now, (1 - self.tokens) / self.rate)
+
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded(f"{self.name} rate limit wait of {wait:.1f}s exceeds run deadline")
+            time.sleep(wait)
+            waited += wait
+
+        if waited:
+            METRICS.record(f'{self.name}_rate_limit_wait', waited)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (e.g. after a 429 with Retry-After)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """Adapt to Retry-After and remaining/reset quota headers from a response"""
+        retry_after = retry_after_seconds(headers)
+        if retry_after:
+            self.pause(retry_after)
+
+        remaining, reset = quota_from_headers(headers)
+        if remaining is None or not reset:
+            return
+        with self._lock:
+            if remaining < 1:
+                self._paused_until = max(self._paused_until, time.monotonic() + reset)
+            elif remaining <= self.capacity:
+                # Close to the limit: spread what is left evenly over the time until reset
+                self.rate = max(0.01, min(self.max_rate, remaining / reset))
+            else:
+                self.rate = self.max_rate
+
+def backoff_delay(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """Exponential backoff with jitter: uniformly 50-100% of min(cap, base * 2**attempt)"""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+def call_with_retry(fn, limiter, is_retryable, headers_of=lambda error: None,
+                    max_attempts=MAX_ATTEMPTS, deadline=None):
+    """Call fn() through limiter, retrying retryable errors with jittered backoff
+
+    The server's Retry-After wins over the computed backoff. Gives up (re-raising
+    the last error) after max_attempts or when the next wait would overrun the
+    deadline (the current run's deadline by default).
+    """
+    if deadline is None:
+        deadline = run_deadline()
+
+    for attempt in range(max_attempts):
+        limiter.acquire(deadline)
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_attempts - 1 or not is_retryable(e):
+                raise
+
+            headers = headers_of(e)
+            limiter.update_from_headers(headers)
+            delay = retry_after_seconds(headers) or backoff_delay(attempt)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise
+
+            METRICS.increment(f'{limiter.name}_retries')
+            print(f"   ⚠ {limiter.name} call failed ({str(e)[:80]}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 2}/{max_attempts})")
+            time.sleep(delay)
@@ -4,60 +4,95 @@ Multi-Subreddit Reddit Automation
 Monitors multiple leadership/management subreddits and generates tailored content
 """
 
+import argparse
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from openai import OpenAI
-
-# Initialize OpenAI client
-client = OpenAI()
-
-# Subreddit configurations with tone guidance
-SUBREDDITS = {
-    'Leadership': {
-        'url': 'https://www.reddit.com/r/Leadership/.json',
-        'tone': 'thought-provoking, challenging conventional wisdom',
-        'focus': 'leadership philosophy, team dynamics, empowerment'
-    },
-    'managers': {
-        'url': 'https://www.reddit.com/r/managers/.json',
-        'tone': 'practical, actionable advice for day-to-day management',
-        'focus': 'team issues, conflict resolution, performance management'
-    },
-    'AskManagers': {
-        'url': 'https://www.reddit.com/r/AskManagers/.json',
-        'tone': 'helpful, direct answers to specific questions',
-        'focus': 'workplace dynamics, management challenges, specific situations'
-    },
-    'Work': {
-        'url': 'https://www.reddit.com/r/Work/.json',
-        'tone': 'broad, relatable insights across industries',
-        'focus': 'workplace culture, job issues, work-life balance'
-    },
-    'Executives': {
-        'url': 'https://www.reddit.com/r/Executives/.json',
-        'tone': 'strategic, high-level thinking',
-        'focus': 'decision-making, organizational strategy, leadership at scale'
-    },
-    'BadBosses': {
-        'url': 'https://www.reddit.com/r/BadBosses/.json',
-        'tone': 'empathetic, constructive reframing, avoid being defensive',
-        'focus': 'learning from negative examples, positive leadership lessons'
-    },
-    'antiwork': {
-        'url': 'https://www.reddit.com/r/antiwork/.json',
-        'tone': 'constructive, systemic insights, validate concerns',
-        'focus': 'workplace issues, power dynamics, employee empowerment'
-    }
-}
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from book_index import BookIndex, estimate_tokens
+from completion_cache import CompletionCache, completion_key
+from json_stream import InvalidJSONStream, JSONItemStream
+from listing_cursors import MAX_POST_ATTEMPTS, ListingCursors
+from metrics import METRICS, METRICS_DIR, METRICS_PROM_FILE
+from output_writer import BlockWriter, DocsSink, FileSink, IndexedFileSink
+from post_ranking import rank_posts
+from prompt_templates import (MIN_CACHED_PREFIX_TOKENS, batch_response_messages, question_messages,
+                              response_messages, shared_prefix_tokens)
+from rate_limit import TokenBucket, call_with_retry, start_run_deadline
+from reddit_http import fetch_json, prune_cache
+from run_log import RunLog, iter_records, question_records, render_records, response_records
+from seen_posts import SeenPostIndex
+from shards import (SHARD_DIR, ShardLog, cursor_record, drop_shard_records, list_shard_files, parse_shard,
+                    read_shard_records, select_shard, shard_file)
+
+# OpenAI client, created on first use (importing the SDK alone costs ~0.5s);
+# retries are handled by call_with_retry, not the SDK
+client = None
+_client_lock = threading.Lock()
+
+# Subreddit configurations with tone guidance, in output order (subreddits.json next to this script)
+SUBREDDITS_FILE = os.environ.get(
+    'SUBREDDITS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'subreddits.json')
+)
+
+def load_subreddits(path=None):
+    """Load the {name: {'url', 'tone', 'focus'}} subreddit config"""
+    with open(path or SUBREDDITS_FILE, 'r') as f:
+        return json.load(f)
+
+SUBREDDITS = load_subreddits()
 
 # Google Docs IDs
 QUESTIONS_DOC_ID = "1CYECMcw8pPu-a7H27ChbKcRWVnV7PQJKy5QHsSvJElw"
 COMMENTS_DOC_ID = "1trD4JzyBQtHEKXt0lVWPfayGo89kM182T_HXAupYP3A"
 
+# Output locations
+OUTPUT_DIR = "/home/ubuntu"
+ALL_QUESTIONS_FILE = os.path.join(OUTPUT_DIR, "all_questions.txt")
+ALL_RESPONSES_FILE = os.path.join(OUTPUT_DIR, "all_responses.txt")
+
 # Book content summary
 BOOK_SUMMARY_FILE = "/home/ubuntu/book_summary.md"
 
+# OpenAI model used for all completions
+MODEL = "gpt-4.1-mini"
+
+# Completion cache switches per call site. Questions are meant to be fresh on every
+# run, so only responses (deterministic per post; re-paid on retried runs) are cached.
+CACHE_QUESTIONS = False
+CACHE_RESPONSES = True
+
+# Answer all selected posts of a subreddit in one JSON-mode completion instead of one call per post
+BATCH_RESPONSES = True
+
+# Posts fetched when a subreddit has no cursor yet; all are ranked locally and only the best get completions
+FETCH_WINDOW = 25
+
+# Incremental /new paging: Reddit's maximum page size, and a cap on pages per subreddit per run
+PAGE_SIZE = 100
+MAX_PAGES = 10
+RESPONSES_PER_SUBREDDIT = 3
+
+# Stream question completions: each question is surfaced as soon as its JSON object closes, and
+# output that can no longer become valid JSON is abandoned and re-requested (bypasses the cache)
+STREAM_QUESTIONS = True
+QUESTION_STREAM_ATTEMPTS = 3
+
+# Drop questions that near-duplicate an earlier one (see question_index) and ask again instead
+DEDUPE_QUESTIONS = True
+
+# Shared OpenAI limiter: bursts of OPENAI_BURST requests, then OPENAI_RATE per second
+# (adapted at runtime from the x-ratelimit-*-requests headers)
+OPENAI_RATE = 5.0
+OPENAI_BURST = 10
+OPENAI_LIMITER = TokenBucket('openai', rate=OPENAI_RATE, capacity=OPENAI_BURST)
+
+# Maximum number of subreddits processed concurrently (1 = sequential); larger sets are sharded
+MAX_WORKERS = int(os.environ.get('REDDIT_MAX_WORKERS', min(len(SUBREDDITS), 16)))
+
 def load_book_content():
     """Load book summary"""
     try:
@@ -66,298 +101,1051 @@ def load_book_content():
     except:
         return "Leadership concepts from 'Leadership Is Overrated'"
 
-def fetch_subreddit_posts(subreddit_name, url, limit=5):
-    """Fetch recent posts from a subreddit"""
-    import requests
+_completion_cache = None
+_completion_cache_lock = threading.Lock()
+
+def get_completion_cache():
+    """Return the shared completion cache, opening it on first use"""
+    global _completion_cache
+    
+    with _completion_cache_lock:
+        if _completion_cache is None:
+            _completion_cache = CompletionCache()
+        return _completion_cache
+
+def get_openai_client():
+    """Return the shared OpenAI client, importing the SDK and creating it on first use"""
+    global client
+    
+    with _client_lock:
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(max_retries=0)
+        return client
+
+_question_index = None
+_question_index_lock = threading.Lock()
+
+def get_question_index():
+    """Return the shared question similarity index, opening it on first use
+    
+    A missing index is seeded from the questions already in the run log.
+    Imported lazily: it pulls in NumPy.
+    """
+    global _question_index
+    from question_index import QuestionIndex, question_text
+    
+    with _question_index_lock:
+        if _question_index is None:
+            index = QuestionIndex()
+            if not len(index):
+                index.add_many(question_text(record) for record in iter_records(kind='question'))
+            _question_index = index
+        return _question_index
+
+def claim_question(subreddit_name, question):
+    """True if the question is new enough to publish (it is then claimed); False for a near-duplicate
+    
+    A claim only lasts beyond this run once settle_questions() commits it.
+    """
+    if not DEDUPE_QUESTIONS:
+        return True
+    from question_index import question_text
+    
+    with METRICS.stage('question_dedupe'):
+        added, similarity = get_question_index().claim(question_text(question))
+    if not added:
+        METRICS.increment('question_duplicates')
+        print(f"   - r/{subreddit_name}: dropped near-duplicate question ({similarity:.0%} similar): "
+              f"{question['title'][:60]}")
+    return added
+
+def settle_questions(questions, published):
+    """Commit the claims of questions whose block was published, or release them if it was not"""
+    if not DEDUPE_QUESTIONS or not questions:
+        return
+    from question_index import question_text
+    
+    index = get_question_index()
+    texts = [question_text(question) for question in questions]
+    if published:
+        index.commit(texts)
+    else:
+        index.release(texts)
+
+def settle_merged_questions(records):
+    """Persist merged shard questions in the similarity index (shards only claim them in memory)"""
+    if not DEDUPE_QUESTIONS or not records:
+        return
+    from question_index import question_text
+    
+    get_question_index().add_many(question_text(record) for record in records)
+
+def is_retryable_openai_error(error):
+    """Throttling, timeouts, connection failures and 5xx are retried; quota exhaustion is not"""
+    import openai
+    
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        if getattr(error, 'code', None) == 'insufficient_quota':
+            return False
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+def openai_error_headers(error):
+    """Response headers of a failed OpenAI call, if any"""
+    response = getattr(error, 'response', None)
+    return getattr(response, 'headers', None)
+
+def chat_completion(messages, temperature, use_cache=False, stage='completion', **params):
+    """Run a chat completion, optionally through the completion cache
+    
+    Returns a dict with the message content, model, token usage, latency and
+    whether it was served from the cache. Latency and token usage are
+    recorded in METRICS under `stage`.
+    """
+    start = time.perf_counter()
+    cache = get_completion_cache() if use_cache else None
+    key = completion_key(MODEL, messages, temperature, **params) if cache else None
+    
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            cached['cached'] = True
+            cached['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            METRICS.increment('completion_cache_hits')
+            return cached
+    
+    def create():
+        raw = get_openai_client().chat.completions.with_raw_response.create(
+            model=MODEL,
+            messages=messages,
+            temperature=temperature,
+            **params
+        )
+        OPENAI_LIMITER.update_from_headers(raw.headers)
+        return raw.parse()
+    
+    with METRICS.stage(stage):
+        response = call_with_retry(create, OPENAI_LIMITER, is_retryable_openai_error, openai_error_headers)
+    
+    usage = getattr(response, 'usage', None)
+    result = {
+        'content': response.choices[0].message.content.strip(),
+        'model': getattr(response, 'model', None) or MODEL,
+        'usage': usage.model_dump() if usage is not None else {},
+        'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+        'cached': False
+    }
+    
+    METRICS.increment('completions')
+    METRICS.record_usage(stage, result['usage'])
+    
+    if cache:
+        cache.put(key, result)
+    
+    return result
+
+def stream_json_items(messages, temperature, stage='completion', list_keys=('data',), **params):
+    """Stream a JSON-mode chat completion, yielding (item, completion) as each list item completes
+    
+    A document with no list of objects in it is unwrapped like parse_json_list
+    does once it is complete, so both paths accept the same shapes. Raises InvalidJSONStream as soon as the output can no longer become valid
+    JSON, and closes the stream whenever iteration stops early so no further
+    tokens are generated. `completion` is one dict per stream (same keys as
+    chat_completion's result); its content, usage and latency are filled in
+    when the stream ends, and usage stays empty if it was abandoned.
+    """
+    start = time.perf_counter()
+    completion = {'content': '', 'model': MODEL, 'usage': {}, 'latency_ms': None, 'cached': False}
+    
+    def create():
+        raw = get_openai_client().chat.completions.with_raw_response.create(
+            model=MODEL,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            stream_options={'include_usage': True},
+            **params
+        )
+        OPENAI_LIMITER.update_from_headers(raw.headers)
+        return raw.parse()
     
+    stream = call_with_retry(create, OPENAI_LIMITER, is_retryable_openai_error, openai_error_headers)
+    parser = JSONItemStream()
+    text = []
     try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, timeout=10)
+        for chunk in stream:
+            if getattr(chunk, 'model', None):
+                completion['model'] = chunk.model
+            if getattr(chunk, 'usage', None) is not None:
+                completion['usage'] = chunk.usage.model_dump()
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            
+            delta = chunk.choices[0].delta.content
+            text.append(delta)
+            items = parser.feed(delta)
+            if items and parser.items == len(items):
+                METRICS.record(f'{stage}_first_item', time.perf_counter() - start)
+            for item in items:
+                yield item, completion
+        
+        document = parser.finish()
+        if document is not None:
+            METRICS.record(f'{stage}_first_item', time.perf_counter() - start)
+            for item in unwrap_json_list(document, list_keys):
+                yield item, completion
+    finally:
+        stream.close()
+        elapsed = time.perf_counter() - start
+        completion['content'] = ''.join(text).strip()
+        completion['latency_ms'] = round(elapsed * 1000, 1)
+        METRICS.record(stage, elapsed)
+        METRICS.increment('completions')
+        METRICS.record_usage(stage, completion['usage'])
+
+def split_usage(usage, parts, part):
+    """Share `part` (0-based) of a `usage` dict split evenly across `parts` items
+    
+    Counts stay whole numbers, and the shares of all parts add up to the
+    original counts, so summing per-item usage counts a batch exactly once.
+    A share's total_tokens is its own prompt_tokens + completion_tokens
+    (splitting each count separately rounds them independently).
+    """
+    share = {}
+    for key, value in usage.items():
+        if isinstance(value, dict):
+            share[key] = split_usage(value, parts, part)
+        elif isinstance(value, int) and not isinstance(value, bool):
+            share[key] = value // parts + (1 if part < value % parts else 0)
+        else:
+            share[key] = value
+    if 'total_tokens' in share and isinstance(share.get('prompt_tokens'), int) \
+            and isinstance(share.get('completion_tokens'), int):
+        share['total_tokens'] = share['prompt_tokens'] + share['completion_tokens']
+    return share
+
+def completion_meta(completion, batch_size=1, part=0, parts=None):
+    """Provenance of a generated item: model, token usage, latency and batch size
+    
+    One completion may produce several items; each records only its share
+    (part of parts, default batch_size) of the completion's token usage.
+    """
+    parts = parts or batch_size
+    return {
+        'model': completion['model'],
+        'usage': split_usage(completion['usage'] or {}, parts, part) if parts > 1 else completion['usage'],
+        'latency_ms': completion['latency_ms'],
+        'cached': completion['cached'],
+        'batch_size': batch_size
+    }
+
+def load_book_index():
+    """Load the book summary and index it for per-prompt passage retrieval"""
+    return BookIndex.from_text(load_book_content())
+
+def with_query(url, **params):
+    """url with the given query parameters added (or replaced); parameters set to None are left out"""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update({key: str(value) for key, value in params.items() if value is not None})
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def new_listing_url(url):
+    """The /new.json listing of a subreddit listing URL such as .../r/<name>/.json"""
+    parts = urlsplit(url)
+    path = parts.path
+    if path.endswith('.json'):
+        path = path[:-len('.json')]
+    path = path.rstrip('/')
+    if not path.endswith('/new'):
+        path += '/new'
+    return urlunsplit(parts._replace(path=f"{path}.json"))
+
+def _listing_source(sources):
+    """Source of a multi-page fetch: 'network' if any page had to be downloaded"""
+    if not sources or 'network' in sources:
+        return 'network'
+    return 'not-modified' if 'not-modified' in sources else 'cache'
+
+def fetch_listing_delta(url, limit=FETCH_WINDOW, cursor=None):
+    """Listing children posted after `cursor`, newest first
+    
+    Pages /new.json?before=<cursor> towards newer posts until Reddit reports
+    no more (or MAX_PAGES). If that finds nothing, one /new.json?limit=2
+    checks whether Reddit really has nothing newer: when it does, the
+    cursor's post was removed (before= then returns nothing), so the listing
+    is paged from the newest post back to the cursor's creation time instead.
+    Without a cursor, returns the latest `limit` posts.
+    
+    Returns (status_code, children, source, capped); capped is True when
+    MAX_PAGES ran out before the cursor or the newest post was reached. A
+    failure after the first page keeps the pages already fetched.
+    """
+    new_url = new_listing_url(url)
+    if not cursor or not cursor.get('fullname'):
+        status_code, data, source = fetch_json(with_query(new_url, limit=limit))
+        METRICS.increment('reddit_pages')
+        if status_code != 200:
+            return status_code, [], source, False
+        return 200, data['data']['children'], source, False
+    
+    children = []
+    sources = set()
+    before = cursor['fullname']
+    for page in range(MAX_PAGES):
+        # Revalidated like any listing, so an unchanged page costs a 304
+        status_code, data, source = fetch_json(with_query(new_url, limit=PAGE_SIZE, before=before))
+        METRICS.increment('reddit_pages')
+        if status_code != 200:
+            if children:
+                return 200, children, 'network', False
+            return status_code, [], source, False
+        
+        sources.add(source)
+        page_children = data['data']['children']
+        # Each page holds the posts just newer than the last, newest first
+        children = page_children + children
+        before = data['data'].get('before')
+        if not before or len(page_children) < PAGE_SIZE:
+            capped = False
+            break
+    else:
+        capped = True
+    if children:
+        return 200, children, _listing_source(sources), capped
+    
+    # Two posts, in case the first is a stickied one
+    status_code, data, source = fetch_json(with_query(new_url, limit=2))
+    METRICS.increment('reddit_pages')
+    if status_code != 200:
+        return status_code, [], source, False
+    sources.add(source)
+    latest = [child for child in data['data']['children'] if not child['data'].get('stickied')]
+    if not latest or (latest[0]['data'].get('created_utc') or 0) <= (cursor.get('created_utc') or 0):
+        return 200, [], _listing_source(sources), False
+    
+    # The cursor's post is gone: walk back from the newest post to the cursor's time
+    print(f"   - {new_url}: cursor post {cursor['fullname']} no longer listed; paging back to its time")
+    children = []
+    after = None
+    for page in range(MAX_PAGES):
+        status_code, data, source = fetch_json(with_query(new_url, limit=PAGE_SIZE, after=after))
+        METRICS.increment('reddit_pages')
+        if status_code != 200:
+            if children:
+                return 200, children, 'network', False
+            return status_code, [], source, False
+        
+        sources.add(source)
+        page_children = data['data']['children']
+        posts = [child for child in page_children if not child['data'].get('stickied')]
+        newer = [child for child in posts if (child['data'].get('created_utc') or 0) > (cursor.get('created_utc') or 0)]
+        children.extend(newer)
+        after = data['data'].get('after')
+        if not after or len(newer) < len(posts) or len(page_children) < PAGE_SIZE:
+            return 200, children, _listing_source(sources), False
+    return 200, children, _listing_source(sources), True
+
+def fetch_subreddit_posts(subreddit_name, url, limit=FETCH_WINDOW, seen=None, cursor=None):
+    """Fetch the posts made since `cursor`, skipping posts already in the seen index
+    
+    Returns (posts, newest, capped) where newest is the cursor for the next
+    run ({'fullname', 'created_utc'} of the newest post fetched) or None, and
+    capped is True when MAX_PAGES stopped the paging short.
+    """
+    try:
+        with METRICS.stage('reddit_fetch'):
+            status_code, children, source, capped = fetch_listing_delta(url, limit=limit, cursor=cursor)
+        METRICS.increment(f'reddit_fetch_{source}')
         
-        if response.status_code == 200:
-            data = response.json()
+        if status_code == 200:
             posts = []
+            skipped = 0
+            newest = None
             
-            for post in data['data']['children'][:limit]:
-                post_data = post['data']
-                posts.append({
+            for child in children:
+                post_data = child['data']
+                post = {
+                    'id': post_data.get('name', ''),
                     'title': post_data.get('title', ''),
                     'selftext': post_data.get('selftext', ''),
                     'author': post_data.get('author', ''),
                     'url': f"https://reddit.com{post_data.get('permalink', '')}",
-                    'subreddit': subreddit_name
-                })
+                    'subreddit': subreddit_name,
+                    'score': post_data.get('score', 0),
+                    'num_comments': post_data.get('num_comments', 0),
+                    'stickied': post_data.get('stickied', False),
+                    'created_utc': post_data.get('created_utc'),
+                    'is_self': post_data.get('is_self', True)
+                }
+                
+                if not post['stickied'] and (newest is None or (post['created_utc'] or 0) > newest['created_utc']):
+                    newest = {'fullname': post['id'], 'created_utc': post['created_utc'] or 0}
+                
+                if seen is not None and post in seen:
+                    skipped += 1
+                    continue
+                posts.append(post)
+            
+            if skipped:
+                print(f"   - r/{subreddit_name}: skipped {skipped} already-answered post(s)")
+            if source != 'network':
+                print(f"   - r/{subreddit_name} listing unchanged ({source})")
+            elif cursor and not children:
+                print(f"   - r/{subreddit_name}: no new posts since last run")
+            if capped:
+                print(f"   ⚠ r/{subreddit_name}: more new posts than {MAX_PAGES} pages; older ones skipped")
             
-            return posts
+            return posts, newest, capped
         else:
-            print(f"   ⚠ Failed to fetch r/{subreddit_name}: HTTP {response.status_code}")
-            return []
+            print(f"   ⚠ Failed to fetch r/{subreddit_name}: HTTP {status_code}")
+            return [], None, False
     except Exception as e:
         print(f"   ⚠ Error fetching r/{subreddit_name}: {str(e)}")
-        return []
+        return [], None, False
 
-def generate_questions(subreddit_name, config, book_content, num_questions=1):
-    """Generate thought-provoking questions for a specific subreddit"""
+def settle_cursor(cursors, subreddit_name, newest, unanswered=(), capped=False):
+    """Move a subreddit's cursor past this run's posts once its output is written; returns True if it moved
     
-    prompt = f"""You are a leadership expert contributing to r/{subreddit_name}.
-
-SUBREDDIT CONTEXT:
-- Tone: {config['tone']}
-- Focus: {config['focus']}
+    While a post picked for a response goes unanswered the cursor holds, so
+    the next run re-reads and retries it, but only until a post has gone
+    unanswered MAX_POST_ATTEMPTS runs in a row: then it is given up on. When
+    MAX_PAGES cut the paging short the cursor moves regardless, or the
+    newest posts would never be reached.
+    """
+    if unanswered and not capped:
+        attempts = cursors.record_failures(subreddit_name, unanswered)
+        if max(attempts.values()) < MAX_POST_ATTEMPTS:
+            print(f"   ⚠ r/{subreddit_name}: {len(unanswered)} selected post(s) unanswered; "
+                  f"cursor not advanced, they will be retried next run")
+            return False
+        print(f"   ⚠ r/{subreddit_name}: giving up on {len(unanswered)} post(s) unanswered "
+              f"for up to {max(attempts.values())} runs")
+    return cursors.advance(subreddit_name, newest)
 
-BOOK INSIGHTS:
-{book_content[:1000]}
+def unwrap_json_list(data, list_keys=('data',)):
+    """The list of items in a parsed completion: the value under one of list_keys
+    (or any other list value) of an object, a bare array, or a single object"""
+    if isinstance(data, dict):
+        # If it's an object with a known list key, extract that
+        for key in list_keys:
+            if key in data:
+                items = data[key]
+                break
+        else:
+            # Try to find the first list value
+            for value in data.values():
+                if isinstance(value, list):
+                    items = value
+                    break
+            else:
+                # Single item as object, wrap in list
+                items = [data]
+    else:
+        items = data
+    return items if isinstance(items, list) else [items]
 
-Generate {num_questions} thought-provoking question(s) to post as new discussions in r/{subreddit_name}.
+def parse_json_list(content, list_keys=('data',)):
+    """Parse a completion expected to hold a JSON list, unwrapping common wrappers
+    
+    Accepts a bare array, an object holding the list under one of list_keys
+    (or any other list value), a single object, or JSON inside a markdown fence.
+    """
+    # Try to parse as JSON object first (in case it's wrapped)
+    try:
+        data = json.loads(content)
+    except:
+        # Fallback: try to extract JSON from markdown
+        if '```json' in content:
+            content = content.split('```json')[1].split('```')[0].strip()
+        elif '```' in content:
+            content = content.split('```')[1].split('```')[0].strip()
+        data = json.loads(content)
+    
+    return unwrap_json_list(data, list_keys)
 
-For each question, provide:
-1. A provocative, attention-grabbing title (question format)
-2. A detailed post body (150-250 words) that:
-   - Provides context and examples
-   - Draws on insights from the book (without mentioning it)
-   - Invites discussion and different perspectives
-   - Matches the subreddit's tone and focus
+def is_valid_question(question):
+    """A question object needs a non-empty string title and content"""
+    return (isinstance(question, dict)
+            and isinstance(question.get('title'), str) and question['title'].strip() != ''
+            and isinstance(question.get('content'), str) and question['content'].strip() != '')
 
-IMPORTANT: Return ONLY valid JSON, no other text. Format:
-[{{"title": "Question title?", "content": "Post body text..."}}]"""
+def stream_questions(subreddit_name, config, book_index, num_questions=1, attempts=QUESTION_STREAM_ATTEMPTS):
+    """Yield questions for a subreddit one at a time, as each streams in complete
+    
+    A stream that stops being valid JSON (or yields a malformed question) is
+    abandoned on the spot and re-requested for the questions still missing;
+    questions already yielded are kept. Near-duplicates of earlier questions
+    are skipped, and the re-request asks the model to avoid them. Once
+    num_questions have been yielded the rest of the stream is still read
+    (surplus items are ignored), so its closing usage chunk is recorded.
+    """
+    produced = 0
+    duplicates = []
+    
+    for attempt in range(attempts):
+        messages = question_messages(subreddit_name, config, book_index, num_questions - produced, duplicates)
+        stream = stream_json_items(
+            messages,
+            temperature=0.8,
+            stage='question_generation',
+            list_keys=('questions', 'data'),
+            response_format={"type": "json_object"}
+        )
+        received = []
+        try:
+            for question, completion in stream:
+                if produced >= num_questions:
+                    # Only read on to the usage chunk
+                    continue
+                if not is_valid_question(question):
+                    raise InvalidJSONStream(f"malformed question object: {str(question)[:80]}")
+                if not claim_question(subreddit_name, question):
+                    duplicates.append(question['title'])
+                    continue
+                received.append((question, completion))
+                produced += 1
+                yield question
+        except InvalidJSONStream as e:
+            METRICS.increment('question_stream_aborts')
+            if produced < num_questions:
+                print(f"   ⚠ Abandoned question stream for r/{subreddit_name} ({e}), "
+                      f"attempt {attempt + 1}/{attempts}")
+        finally:
+            stream.close()
+            # Usage and latency are only final once the stream has been closed
+            for part, (question, completion) in enumerate(received):
+                question['completion'] = completion_meta(completion, batch_size=len(received), part=part)
+        
+        if produced >= num_questions:
+            return
 
+def generate_questions(subreddit_name, config, book_index, num_questions=1, use_cache=CACHE_QUESTIONS,
+                       stream=STREAM_QUESTIONS):
+    """Generate thought-provoking questions for a specific subreddit
+    
+    Streams by default (see stream_questions); cached requests use a single
+    blocking completion instead.
+    """
+    if stream and not use_cache:
+        questions = []
+        try:
+            for question in stream_questions(subreddit_name, config, book_index, num_questions):
+                questions.append(question)
+        except Exception as e:
+            print(f"   ⚠ Error generating questions for r/{subreddit_name}: {str(e)}")
+        return questions
+    
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are a JSON generator. Return only valid JSON arrays, no markdown, no explanations."},
-                {"role": "user", "content": prompt}
-            ],
+        completion = chat_completion(
+            messages=question_messages(subreddit_name, config, book_index, num_questions),
             temperature=0.8,
+            use_cache=use_cache,
+            stage='question_generation',
+            list_keys=('questions', 'data'),
             response_format={"type": "json_object"}
         )
         
-        content = response.choices[0].message.content.strip()
+        questions = parse_json_list(completion['content'], list_keys=('questions', 'data'))
+        questions = [q for q in questions if is_valid_question(q) and claim_question(subreddit_name, q)]
+        for part, question in enumerate(questions):
+            question['completion'] = completion_meta(completion, batch_size=len(questions), part=part)
         
-        # Try to parse as JSON object first (in case it's wrapped)
-        try:
-            data = json.loads(content)
-            # If it's an object with a questions key, extract that
-            if isinstance(data, dict):
-                if 'questions' in data:
-                    questions = data['questions']
-                elif 'data' in data:
-                    questions = data['data']
-                else:
-                    # Try to find the first list value
-                    for value in data.values():
-                        if isinstance(value, list):
-                            questions = value
-                            break
-                    else:
-                        # Single question as object, wrap in list
-                        questions = [data]
-            else:
-                questions = data
-        except:
-            # Fallback: try to extract JSON from markdown
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0].strip()
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0].strip()
-            questions = json.loads(content)
-        
-        return questions if isinstance(questions, list) else [questions]
+        return questions
     except Exception as e:
         print(f"   ⚠ Error generating questions for r/{subreddit_name}: {str(e)}")
         # Return empty list instead of failing
         return []
 
-def generate_responses(posts, config, book_content, num_responses=3):
-    """Generate responses to posts from a specific subreddit"""
+def generate_response(post, config, book_index, use_cache=CACHE_RESPONSES):
+    """Generate a response to a single post"""
+    try:
+        completion = chat_completion(
+            messages=response_messages(post, config, book_index),
+            temperature=0.7,
+            use_cache=use_cache,
+            stage='response_generation'
+        )
+        
+        print(f"   - Generated response for: {post['title'][:60]}...")
+        
+        return {
+            'post': post,
+            'response': completion['content'],
+            'completion': completion_meta(completion)
+        }
+        
+    except Exception as e:
+        print(f"   ⚠ Error generating response: {str(e)}")
+        return None
+
+def generate_batch_responses(posts, config, book_index, use_cache=CACHE_RESPONSES):
+    """Generate responses to several posts of one subreddit in a single JSON-mode completion
+    
+    Returns a dict mapping the index of each post in posts to its response.
+    Posts missing from the parsed output are simply absent from the dict.
+    """
+    try:
+        completion = chat_completion(
+            messages=batch_response_messages(posts, config, book_index),
+            temperature=0.7,
+            use_cache=use_cache,
+            stage='batch_response_generation',
+            response_format={"type": "json_object"}
+        )
+        items = parse_json_list(completion['content'], list_keys=('responses', 'data'))
+    except Exception as e:
+        print(f"   ⚠ Error generating batched responses for r/{posts[0]['subreddit']}: {str(e)}")
+        return {}
+    
+    results = {}
+    for item in items:
+        try:
+            index = int(item['post']) - 1
+            text = item['response'].strip()
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        if 0 <= index < len(posts) and text:
+            results[index] = {
+                'post': posts[index],
+                'response': text
+            }
+    
+    # The batch's usage is shared among the responses it actually produced
+    for part, index in enumerate(sorted(results)):
+        results[index]['completion'] = completion_meta(completion, batch_size=len(posts), part=part,
+                                                       parts=len(results))
+    
+    return results
+
+def generate_responses(posts, config, book_index, num_responses=3, use_cache=CACHE_RESPONSES, batch=BATCH_RESPONSES):
+    """Generate responses to the first num_responses posts (pass them ranked best-first)
+    
+    In batch mode all selected posts share one completion; any post the batch
+    fails to answer falls back to its own per-post completion.
+    """
     
     if not posts:
         return []
     
     # Select posts to respond to
     selected_posts = posts[:num_responses]
-    responses = []
     
-    for post in selected_posts:
-        prompt = f"""You are responding to a post in r/{post['subreddit']}.
-
-SUBREDDIT CONTEXT:
-- Tone: {config['tone']}
-- Focus: {config['focus']}
-
-POST:
-Title: {post['title']}
-Content: {post['selftext'][:500]}
-
-BOOK INSIGHTS:
-{book_content}
-
-Write a helpful, thoughtful response (150-300 words) that:
-- Matches the subreddit's tone
-- Provides genuine value and insights
-- Draws on concepts from the book (without mentioning it)
-- Is conversational and empathetic
-- Avoids self-promotion
-
-Return only the response text, no JSON or formatting."""
-
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
-            )
-            
-            response_text = response.choices[0].message.content.strip()
-            
-            responses.append({
-                'post': post,
-                'response': response_text
-            })
-            
+    batched = {}
+    if batch and len(selected_posts) > 1:
+        batched = generate_batch_responses(selected_posts, config, book_index, use_cache=use_cache)
+    
+    responses = []
+    for i, post in enumerate(selected_posts):
+        if i in batched:
+            responses.append(batched[i])
             print(f"   - Generated response for: {post['title'][:60]}...")
-            
-        except Exception as e:
-            print(f"   ⚠ Error generating response: {str(e)}")
+        else:
+            response = generate_response(post, config, book_index, use_cache=use_cache)
+            if response:
+                responses.append(response)
     
     return responses
 
-def format_questions_content(subreddit_name, questions):
+def format_header(subreddit_name, timestamp=None):
+    """Distinctive block separator that opens each subreddit's section"""
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    bar = '█' * 80
+    return f"\n\n{bar}\n{bar}\nSUBREDDIT: r/{subreddit_name}\nGENERATED: {timestamp}\n{bar}\n{bar}\n\n"
+
+def format_questions_content(subreddit_name, questions, timestamp=None):
     """Format questions for output with clear visual separators"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Create distinctive separator for each subreddit
-    content = f"\n\n{'█'*80}\n"
-    content += f"{'█'*80}\n"
-    content += f"SUBREDDIT: r/{subreddit_name}\n"
-    content += f"GENERATED: {timestamp}\n"
-    content += f"{'█'*80}\n"
-    content += f"{'█'*80}\n\n"
+    parts = [format_header(subreddit_name, timestamp)]
     
     for i, q in enumerate(questions, 1):
-        content += f"QUESTION {i} — r/{subreddit_name}\n"
-        content += f"{'-'*80}\n"
-        content += f"TITLE: {q['title']}\n\n"
-        content += f"POST BODY:\n{q['content']}\n\n"
+        parts.append(
+            f"QUESTION {i} — r/{subreddit_name}\n"
+            f"{'-'*80}\n"
+            f"TITLE: {q['title']}\n\n"
+            f"POST BODY:\n{q['content']}\n\n"
+        )
     
-    return content
+    return ''.join(parts)
 
-def format_responses_content(subreddit_name, responses):
+def format_responses_content(subreddit_name, responses, timestamp=None):
     """Format responses for output with clear visual separators"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Create distinctive separator for each subreddit
-    content = f"\n\n{'█'*80}\n"
-    content += f"{'█'*80}\n"
-    content += f"SUBREDDIT: r/{subreddit_name}\n"
-    content += f"GENERATED: {timestamp}\n"
-    content += f"{'█'*80}\n"
-    content += f"{'█'*80}\n\n"
+    parts = [format_header(subreddit_name, timestamp)]
     
     for i, r in enumerate(responses, 1):
-        content += f"RESPONSE {i} — r/{subreddit_name}\n"
-        content += f"{'-'*80}\n"
-        content += f"POST: {r['post']['title']}\n"
-        content += f"AUTHOR: u/{r['post']['author']}\n"
-        content += f"URL: {r['post']['url']}\n\n"
-        content += f"YOUR RESPONSE:\n{r['response']}\n\n"
+        parts.append(
+            f"RESPONSE {i} — r/{subreddit_name}\n"
+            f"{'-'*80}\n"
+            f"POST: {r['post']['title']}\n"
+            f"AUTHOR: u/{r['post']['author']}\n"
+            f"URL: {r['post']['url']}\n\n"
+            f"YOUR RESPONSE:\n{r['response']}\n\n"
+        )
+    
+    return ''.join(parts)
+
+def print_metrics_summary(timestamp):
+    """Write the run's metrics (JSON, optional Prometheus textfile) and print the hot spots"""
+    summary = METRICS.summary()
+    
+    print(f"\nRun metrics ({summary['wall_s']:.1f}s wall):")
+    for name, stats in sorted(summary['stages'].items(), key=lambda item: -item[1]['total_s']):
+        print(f"  {name:<28} {stats['count']:>4} calls  {stats['total_s']:>8.2f}s total  {stats['max_s']:>7.2f}s max")
+    for name, totals in sorted(summary['tokens'].items()):
+        print(f"  {name:<28} {totals.get('prompt_tokens', 0):>7} prompt ({totals.get('prompt_cached_tokens', 0)} cached) / "
+              f"{totals.get('completion_tokens', 0):>6} completion tokens")
+    prompt_tokens = sum(totals.get('prompt_tokens', 0) for totals in summary['tokens'].values())
+    if prompt_tokens:
+        cached_tokens = sum(totals.get('prompt_cached_tokens', 0) for totals in summary['tokens'].values())
+        print(f"  Prompt cache: {cached_tokens} of {prompt_tokens} prompt tokens served from OpenAI's prefix cache "
+              f"({100 * cached_tokens / prompt_tokens:.0f}%)")
     
-    return content
+    try:
+        metrics_file = os.path.join(METRICS_DIR, f"metrics_{timestamp}.json")
+        METRICS.write_json(metrics_file)
+        print(f"  ✓ Metrics saved to: {metrics_file}")
+        if METRICS_PROM_FILE:
+            METRICS.write_prometheus(METRICS_PROM_FILE)
+            print(f"  ✓ Prometheus metrics written to: {METRICS_PROM_FILE}")
+    except Exception as e:
+        print(f"  ⚠ Could not write metrics: {str(e)}")
 
-def main():
-    """Main automation function"""
+def process_subreddit(subreddit_name, config, book_index, seen=None, cursor=None):
+    """Fetch posts and generate questions/responses for a single subreddit"""
+    posts, newest, capped = fetch_subreddit_posts(subreddit_name, config['url'], seen=seen, cursor=cursor)
+    
+    # Drop stickied/link/removed posts and put the best fits to the focus and book first
+    with METRICS.stage('rank_posts'):
+        candidates = rank_posts(posts, config, book_index)
+    METRICS.increment('posts_filtered', len(posts) - len(candidates))
+    
+    # Generate 1 question per subreddit
+    questions = generate_questions(subreddit_name, config, book_index, num_questions=1)
+    
+    # Generate responses for the top-ranked posts only
+    responses = generate_responses(candidates, config, book_index, num_responses=RESPONSES_PER_SUBREDDIT)
+    
+    answered = {r['post']['id'] for r in responses}
+    return {
+        'subreddit': subreddit_name,
+        'posts': posts,
+        'newest': newest,
+        'capped': capped,
+        'candidates': len(candidates),
+        'unanswered': [post['id'] for post in candidates[:RESPONSES_PER_SUBREDDIT] if post['id'] not in answered],
+        'questions': questions,
+        'responses': responses
+    }
+
+def main(max_workers=MAX_WORKERS, shard=None, shard_dir=None):
+    """Main automation function
+    
+    With shard=(index, count) only that shard's subreddits are processed and
+    their records go to the shard file alone; merge_shards() later publishes
+    them to the master files, the run log and Google Docs.
+    """
+    METRICS.reset()
+    start_run_deadline()
+    subreddits = SUBREDDITS if shard is None else select_shard(SUBREDDITS, *shard)
     print("="*80)
-    print("MULTI-SUBREDDIT REDDIT AUTOMATION")
+    print("MULTI-SUBREDDIT REDDIT AUTOMATION" + (f" (shard {shard[0]}/{shard[1]})" if shard else ""))
     print("="*80)
     print(f"Run started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print()
     
     # Load book content
     print("1. Loading book content...")
-    book_content = load_book_content()
-    print("   ✓ Book content loaded")
+    book_index = load_book_index()
+    print(f"   ✓ Book content loaded ({len(book_index.passages)} passages indexed)")
+    seen = SeenPostIndex()
+    print(f"   ✓ {len(seen)} previously answered posts in seen index")
+    cursors = ListingCursors()
+    print(f"   ✓ {len(cursors)} subreddit listing cursors")
+    pruned = prune_cache()
+    if pruned:
+        print(f"   ✓ {pruned} expired HTTP cache entries removed")
     print()
     
-    all_questions_content = ""
-    all_responses_content = ""
+    # Each subreddit's block is streamed to the per-run file, the master file
+    # and Google Docs as soon as it is ready
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    if shard is None:
+        questions_file = os.path.join(OUTPUT_DIR, f"reddit_questions_{timestamp}.txt")
+        responses_file = os.path.join(OUTPUT_DIR, f"reddit_responses_{timestamp}.txt")
+        run_log = RunLog()
+        questions_docs = DocsSink(QUESTIONS_DOC_ID)
+        responses_docs = DocsSink(COMMENTS_DOC_ID)
+        questions_writer = BlockWriter([FileSink(questions_file, 'w'), IndexedFileSink(ALL_QUESTIONS_FILE), questions_docs])
+        responses_writer = BlockWriter([FileSink(responses_file, 'w'), IndexedFileSink(ALL_RESPONSES_FILE), responses_docs])
+    else:
+        # Shards publish nothing themselves; their records are the only output
+        timestamp = f"{timestamp}_shard-{shard[0]}-of-{shard[1]}"
+        run_log = ShardLog(shard_file(*shard, shard_dir))
+        questions_writer = BlockWriter([])
+        responses_writer = BlockWriter([])
     
-    # Process each subreddit
-    for subreddit_name, config in SUBREDDITS.items():
-        print(f"2. Processing r/{subreddit_name}...")
-        
-        # Fetch posts
-        print(f"   - Fetching posts...")
-        posts = fetch_subreddit_posts(subreddit_name, config['url'], limit=5)
-        print(f"   ✓ Found {len(posts)} posts")
-        
-        # Generate 1 question per subreddit
-        print(f"   - Generating question...")
-        questions = generate_questions(subreddit_name, config, book_content, num_questions=1)
-        print(f"   ✓ Generated {len(questions)} question(s)")
-        
-        # Generate 3 responses per subreddit
-        print(f"   - Generating responses...")
-        responses = generate_responses(posts, config, book_content, num_responses=3)
-        print(f"   ✓ Generated {len(responses)} responses")
-        
-        # Format content
-        if questions:
-            all_questions_content += format_questions_content(subreddit_name, questions)
-        if responses:
-            all_responses_content += format_responses_content(subreddit_name, responses)
+    # Process subreddits concurrently; results are collected in config order
+    print(f"2. Processing {len(subreddits)} subreddits ({max(1, max_workers)} workers)...")
+    with questions_writer, responses_writer, ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = executor.map(
+            lambda item: process_subreddit(item[0], item[1], book_index, seen=seen, cursor=cursors.get(item[0])),
+            subreddits.items()
+        )
         
-        print(f"   ✓ r/{subreddit_name} complete")
+        for result in results:
+            subreddit_name = result['subreddit']
+            questions = result['questions']
+            responses = result['responses']
+            
+            print(f"   r/{subreddit_name}:")
+            print(f"   ✓ Found {len(result['posts'])} posts ({result['candidates']} worth answering)")
+            print(f"   ✓ Generated {len(questions)} question(s)")
+            print(f"   ✓ Generated {len(responses)} responses")
+            
+            # Format and write content
+            generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            written = True
+            if questions:
+                with METRICS.stage('format'):
+                    block = format_questions_content(subreddit_name, questions, generated_at)
+                questions_written = questions_writer.write(block)
+                with METRICS.stage('run_log_write'):
+                    run_log.append(question_records(timestamp, subreddit_name, questions, generated_at))
+                # Shard questions are only published (and committed) by the merge
+                if not questions_written:
+                    settle_questions(questions, published=False)
+                elif shard is None:
+                    settle_questions(questions, published=True)
+            if responses:
+                with METRICS.stage('format'):
+                    block = format_responses_content(subreddit_name, responses, generated_at)
+                written = responses_writer.write(block)
+                with METRICS.stage('run_log_write'):
+                    run_log.append(response_records(timestamp, subreddit_name, responses, generated_at))
+                # Only mark posts as seen once their responses are safely on disk
+                # (for shards that happens when they are merged)
+                if not written:
+                    print(f"   ⚠ Responses not saved to disk; posts not marked as answered")
+                elif shard is None:
+                    seen.mark(r['post'] for r in responses)
+            
+            # The next run resumes after the newest post fetched now that this one's output is written
+            if not written:
+                print(f"   ⚠ Cursor not advanced; r/{subreddit_name} will be retried next run")
+            elif shard is None:
+                settle_cursor(cursors, subreddit_name, result['newest'], result['unanswered'], result['capped'])
+            elif result['newest'] or result['unanswered']:
+                # Shards leave the move to the merge, so it only happens once the output is published
+                run_log.append([cursor_record(subreddit_name, result['newest'], result['unanswered'], result['capped'])])
+            
+            METRICS.increment('questions', len(questions))
+            METRICS.increment('responses', len(responses))
+            print(f"   ✓ r/{subreddit_name} complete")
+            print()
+    
+    print("3. Output written")
+    if shard is None:
+        print(f"   ✓ Questions saved to: {questions_file}")
+        print(f"   ✓ Responses saved to: {responses_file}")
+        print(f"   ✓ Appended to master files")
+        print(f"   ✓ {run_log.records} records appended to run log")
+        print(f"   ✓ {len(seen)} posts in seen index")
         print()
+        
+        print("4. Google Docs")
+        print_docs_summary(questions_docs, responses_docs)
+    else:
+        print(f"   ✓ {run_log.records} records written to shard file: {run_log.path}")
+        print(f"   ✓ Run with --merge once all shards are done to publish them")
     
-    # Save to timestamped files
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    questions_file = f"/home/ubuntu/reddit_questions_{timestamp}.txt"
-    responses_file = f"/home/ubuntu/reddit_responses_{timestamp}.txt"
-    
-    print("3. Saving to files...")
-    with open(questions_file, 'w') as f:
-        f.write(all_questions_content)
-    with open(responses_file, 'w') as f:
-        f.write(all_responses_content)
-    print(f"   ✓ Questions saved to: {questions_file}")
-    print(f"   ✓ Responses saved to: {responses_file}")
-    print()
+    print("\n" + "="*80)
+    print("RUN COMPLETE!")
+    print("="*80)
+    if _completion_cache is not None:
+        stats = _completion_cache.stats()
+        print(f"\nCompletion cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['entries']} entries ({stats['bytes'] // 1024} KB)")
+    print_metrics_summary(timestamp)
+    print(f"\nProcessed {len(subreddits)} subreddits")
+    print(f"Generated ~{len(subreddits)} questions and ~{len(subreddits)*RESPONSES_PER_SUBREDDIT} responses")
+    if shard is None:
+        print_docs_links()
+        print(f"\nContent has been automatically posted to your Google Docs!")
+
+def check_subreddit(subreddit_name, config, book_index, seen, cursor, dry_run):
+    """Fetch and rank one subreddit; with dry_run also build the prompts a real run would send"""
+    posts, newest, _ = fetch_subreddit_posts(subreddit_name, config['url'], seen=seen, cursor=cursor)
+    candidates = rank_posts(posts, config, book_index)
+    selected = candidates[:RESPONSES_PER_SUBREDDIT]
     
-    # Append to master files
-    print("4. Appending to master files...")
-    with open("/home/ubuntu/all_questions.txt", 'a') as f:
-        f.write(all_questions_content)
-    with open("/home/ubuntu/all_responses.txt", 'a') as f:
-        f.write(all_responses_content)
-    print("   ✓ Appended to master files")
-    print()
+    prompts = []
+    if dry_run:
+        prompts.append(question_messages(subreddit_name, config, book_index, 1))
+        if BATCH_RESPONSES and len(selected) > 1:
+            prompts.append(batch_response_messages(selected, config, book_index))
+        else:
+            prompts.extend(response_messages(post, config, book_index) for post in selected)
     
-    # Update Google Docs
-    print("5. Updating Google Docs...")
-    try:
-        import subprocess
-        result = subprocess.run(
-            ['python3.11', '/home/ubuntu/update_and_format_docs.py', questions_file, responses_file],
-            capture_output=True,
-            text=True,
-            timeout=30
+    return {
+        'subreddit': subreddit_name,
+        'posts': posts,
+        'selected': selected,
+        'candidates': len(candidates),
+        'prompt_tokens': sum(estimate_tokens(m['content']) for messages in prompts for m in messages),
+        'prefix_tokens': shared_prefix_tokens(book_index, subreddit_name, config) if dry_run else 0,
+        'completions': len(prompts)
+    }
+
+def check_run(dry_run=False, max_workers=MAX_WORKERS, shard=None):
+    """Health check: fetch and rank every subreddit without OpenAI, Google Docs or any output
+    
+    Imports neither the OpenAI nor the Google client libraries. Cursors and
+    the seen index are read but not advanced. With dry_run, the prompts of a
+    real run are also built and their size reported.
+    """
+    start = time.perf_counter()
+    METRICS.reset()
+    start_run_deadline()
+    subreddits = SUBREDDITS if shard is None else select_shard(SUBREDDITS, *shard)
+    mode = "DRY RUN" if dry_run else "FETCH ONLY"
+    print(f"{mode}: {len(subreddits)} subreddits, no completions, no Google Docs, no output written")
+    
+    book_index = load_book_index()
+    seen = SeenPostIndex()
+    cursors = ListingCursors()
+    
+    total_tokens = 0
+    total_completions = 0
+    prefix_tokens = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = executor.map(
+            lambda item: check_subreddit(item[0], item[1], book_index, seen, cursors.get(item[0]), dry_run),
+            subreddits.items()
         )
-        if result.returncode == 0:
-            print("   ✓ Google Docs updated successfully")
+        for result in results:
+            line = f"   r/{result['subreddit']}: {len(result['posts'])} posts, {result['candidates']} worth answering"
+            if dry_run:
+                line += (f", {result['completions']} completion(s) ~{result['prompt_tokens']} prompt tokens"
+                         f" (~{result['prefix_tokens']} shared prefix)")
+            print(line)
+            for post in result['selected']:
+                print(f"      {post['relevance']:6.2f}  {post['title'][:70]}")
+            total_tokens += result['prompt_tokens']
+            prefix_tokens.append(result['prefix_tokens'])
+            total_completions += result['completions']
+    
+    if dry_run:
+        print(f"\nWould send {total_completions} completion(s), ~{total_tokens} prompt tokens")
+        if prefix_tokens and min(prefix_tokens) < MIN_CACHED_PREFIX_TOKENS:
+            print(f"Shared prompt prefix is as short as ~{min(prefix_tokens)} tokens; OpenAI only caches "
+                  f"prefixes of {MIN_CACHED_PREFIX_TOKENS}+ tokens")
+    print(f"Checked {len(subreddits)} subreddits in {time.perf_counter() - start:.2f}s")
+
+def print_docs_summary(questions_docs, responses_docs):
+    """Report how many blocks reached each Google Doc"""
+    for doc_name, sink in (("Questions", questions_docs), ("Comments", responses_docs)):
+        if sink.failed:
+            print(f"   ⚠ {doc_name}: {sink.appended} block(s) appended, {sink.failed} failed")
         else:
-            print(f"   ⚠ Google Docs update failed: {result.stderr}")
-    except Exception as e:
-        print(f"   ⚠ Could not update Google Docs: {str(e)}")
+            print(f"   ✓ {doc_name}: {sink.appended} block(s) appended")
+
+def print_docs_links():
+    from update_and_format_docs import current_segment_id
     
-    print("\n" + "="*80)
-    print("RUN COMPLETE!")
+    print(f"\nGoogle Docs (current segments):")
+    print(f"  Questions: https://docs.google.com/document/d/{current_segment_id(QUESTIONS_DOC_ID)}/edit")
+    print(f"  Comments:  https://docs.google.com/document/d/{current_segment_id(COMMENTS_DOC_ID)}/edit")
+
+def merge_shards(shard_dir=None):
+    """Publish the records of finished shards as one run
+    
+    Blocks are re-rendered in SUBREDDITS order into a per-run file and the
+    master files, and sent to each Google Doc as a single update. Once a
+    kind (questions, responses) is on disk its records are appended to the
+    run log (responses also mark their posts as seen) and dropped from the
+    shard files, so a merge retried after a partial failure publishes only
+    what is left. The listing cursors the shards recorded are settled once
+    the responses are published, and the emptied shard files removed.
+    """
     print("="*80)
-    print(f"\nProcessed {len(SUBREDDITS)} subreddits")
-    print(f"Generated ~{len(SUBREDDITS)} questions and ~{len(SUBREDDITS)*3} responses")
-    print(f"\nGoogle Docs:")
-    print(f"  Questions: https://docs.google.com/document/d/{QUESTIONS_DOC_ID}/edit")
-    print(f"  Comments:  https://docs.google.com/document/d/{COMMENTS_DOC_ID}/edit")
-    print(f"\nContent has been automatically posted to your Google Docs!")
+    print("MERGING SHARD OUTPUTS")
+    print("="*80)
+    
+    paths = list_shard_files(shard_dir)
+    records = read_shard_records(paths, subreddit_order=SUBREDDITS)
+    cursor_updates = [r for r in records if r['type'] == 'cursor']
+    records = [r for r in records if r['type'] != 'cursor']
+    print(f"   ✓ {len(records)} records from {len(paths)} shard file(s) in {shard_dir or SHARD_DIR}")
+    if not records and not cursor_updates:
+        print("   Nothing to merge")
+        return
+    
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    questions = [r for r in records if r['type'] == 'question']
+    responses = [r for r in records if r['type'] == 'response']
+    
+    # One block per subreddit, joined so each Doc gets a single batchUpdate
+    questions_docs = DocsSink(QUESTIONS_DOC_ID)
+    responses_docs = DocsSink(COMMENTS_DOC_ID)
+    written = True
+    for kind, record_type, items, master_file, docs in (
+        ('questions', 'question', questions, ALL_QUESTIONS_FILE, questions_docs),
+        ('responses', 'response', responses, ALL_RESPONSES_FILE, responses_docs),
+    ):
+        if not items:
+            continue
+        run_file = os.path.join(OUTPUT_DIR, f"reddit_{kind}_{timestamp}.txt")
+        with METRICS.stage('format'):
+            content = ''.join(render_records(items))
+        with BlockWriter([FileSink(run_file, 'w'), IndexedFileSink(master_file), docs]) as writer:
+            if not writer.write(content):
+                # Nothing of this kind is recorded as published; its records stay for another --merge
+                print(f"   ⚠ {kind.capitalize()} not saved to disk; kept in the shard files")
+                written = False
+                continue
+        
+        print(f"   ✓ {len(items)} {kind} saved to: {run_file}")
+        if record_type == 'question':
+            settle_merged_questions(items)
+        else:
+            SeenPostIndex().mark({'id': r['post_id'], 'url': r['url']} for r in items)
+        RunLog().append(items)
+        drop_shard_records(paths, record_type)
+    
+    if not written:
+        print(f"   ⚠ Listing cursors not advanced; run --merge again to publish the rest")
+        return
+    
+    cursors = ListingCursors()
+    for update in cursor_updates:
+        settle_cursor(cursors, update['subreddit'], update['newest'], update.get('unanswered', ()), update.get('capped', False))
+    print(f"   ✓ Appended to master files, run log and seen index; {len(cursor_updates)} listing cursor(s) settled")
+    print_docs_summary(questions_docs, responses_docs)
+    
+    for path in paths:
+        os.remove(path)
+    print_docs_links()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate questions and responses for the configured subreddits")
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                        help="process only shard I of N (0-based) and leave its records in the shard directory")
+    parser.add_argument('--merge', action='store_true',
+                        help="publish finished shards to the master files, run log and Google Docs")
+    parser.add_argument('--shard-dir', help=f"directory for shard record files (default {SHARD_DIR})")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help="subreddits processed concurrently")
+    parser.add_argument('--only', choices=['fetch'],
+                        help="fetch: only fetch and rank posts (no OpenAI, no Google Docs, no output)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="fetch, rank and build prompts without calling OpenAI or Google Docs or writing output")
+    args = parser.parse_args()
+    
+    if args.merge:
+        merge_shards(args.shard_dir)
+    elif args.dry_run or args.only == 'fetch':
+        check_run(dry_run=args.dry_run, max_workers=args.workers, shard=args.shard)
+    else:
+        main(max_workers=args.workers, shard=args.shard, shard_dir=args.shard_dir)
@@ -0,0 +1,182 @@
+"""
+Reddit HTTP Layer
+Shared keep-alive session with conditional (ETag/Last-Modified) fetches and a small on-disk response cache
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import TokenBucket, call_with_retry
+
+# On-disk cache of listing responses (one JSON file per URL)
+CACHE_DIR = "/home/ubuntu/.reddit_cache"
+
+# Responses younger than this are served from disk without touching the network
+CACHE_MAX_AGE = 300
+
+# Entries not fetched or revalidated for this long are deleted by prune_cache(); the
+# before=<cursor> pages of past cursors are never requested again once their cursor moves on
+CACHE_EXPIRY = 7 * 86_400
+
+USER_AGENT = 'Mozilla/5.0'
+POOL_SIZE = 16
+
+# Shared Reddit limiter: bursts of REDDIT_BURST requests, then REDDIT_RATE per second
+# (adapted at runtime from Reddit's x-ratelimit-* headers)
+REDDIT_RATE = 1.0
+REDDIT_BURST = 10
+REDDIT_LIMITER = TokenBucket('reddit', rate=REDDIT_RATE, capacity=REDDIT_BURST)
+
+# Statuses worth retrying: throttling and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class RetryableStatus(Exception):
+    """A throttled or transient HTTP response"""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Return the shared pooled HTTP session, creating it on first use"""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({
+                'User-Agent': USER_AGENT,
+                'Accept-Encoding': 'gzip, deflate'
+            })
+            _session = session
+        return _session
+
+def _cache_path(url, cache_dir):
+    """Path of the cache entry for a URL"""
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"{key}.json")
+
+def load_cache_entry(url, cache_dir):
+    """Load a cached response entry, or None if missing/unreadable"""
+    try:
+        with open(_cache_path(url, cache_dir), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def store_cache_entry(url, entry, cache_dir):
+    """Atomically write a cached response entry"""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = _cache_path(url, cache_dir)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"   ⚠ Could not write HTTP cache for {url}: {str(e)}")
+
+def prune_cache(cache_dir=None, expiry=None):
+    """Delete cache entries untouched for longer than CACHE_EXPIRY; returns the number deleted"""
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    expiry = CACHE_EXPIRY if expiry is None else expiry
+    if not cache_dir:
+        return 0
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return 0
+
+    cutoff = time.time() - expiry
+    deleted = 0
+    for name in names:
+        path = os.path.join(cache_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                deleted += 1
+        except OSError:
+            continue
+    return deleted
+
+def _limited_get(url, headers, timeout):
+    """One GET through the shared session, feeding rate-limit headers to the limiter"""
+    response = get_session().get(url, headers=headers, timeout=timeout)
+    REDDIT_LIMITER.update_from_headers(response.headers)
+    if response.status_code in RETRY_STATUSES:
+        raise RetryableStatus(response)
+    return response
+
+def _is_retryable(error):
+    return isinstance(error, (RetryableStatus, requests.ConnectionError, requests.Timeout))
+
+def fetch_json(url, cache_dir=None, max_age=None, timeout=10):
+    """Fetch JSON from a URL, revalidating against the on-disk cache
+
+    Requests go through REDDIT_LIMITER; 429s and 5xx responses are retried
+    with backoff (honouring Retry-After) before giving up.
+
+    Returns (status_code, data, source) where source is 'cache' (fresh entry,
+    no request made), 'not-modified' (304 revalidation) or 'network'.
+    data is None when the request failed. cache_dir and max_age default to
+    CACHE_DIR and CACHE_MAX_AGE; set CACHE_DIR to '' to disable the cache.
+    """
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    if max_age is None:
+        max_age = CACHE_MAX_AGE
+
+    entry = load_cache_entry(url, cache_dir) if cache_dir else None
+
+    if entry and max_age and time.time() - entry.get('fetched_at', 0) < max_age:
+        return 200, entry['data'], 'cache'
+
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    try:
+        response = call_with_retry(
+            lambda: _limited_get(url, headers, timeout),
+            REDDIT_LIMITER,
+            _is_retryable,
+            headers_of=lambda error: error.response.headers if isinstance(error, RetryableStatus) else None
+        )
+    except RetryableStatus as e:
+        # Still throttled/failing after all retries
+        return e.response.status_code, None, 'network'
+
+    if response.status_code == 304 and entry:
+        entry['fetched_at'] = time.time()
+        store_cache_entry(url, entry, cache_dir)
+        return 200, entry['data'], 'not-modified'
+
+    if response.status_code != 200:
+        return response.status_code, None, 'network'
+
+    data = response.json()
+    if cache_dir:
+        store_cache_entry(url, {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+            'data': data
+        }, cache_dir)
+
+    return 200, data, 'network'
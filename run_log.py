@@ -0,0 +1,183 @@
+"""
+Structured Run Log
+Every generated question and response as one JSON record, in monthly JSONL segments, with a streaming reader
+"""
+
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+
+RUN_LOG_DIR = "/home/ubuntu/run_log"
+
+# Write gzip segments (run_log-YYYY-MM.jsonl.gz) instead of plain .jsonl
+RUN_LOG_COMPRESS = False
+
+SEGMENT_PREFIX = 'run_log-'
+
+def segment_name(when, compress=RUN_LOG_COMPRESS):
+    """File name of the monthly segment holding records generated at `when`"""
+    suffix = '.jsonl.gz' if compress else '.jsonl'
+    return f"{SEGMENT_PREFIX}{when.strftime('%Y-%m')}{suffix}"
+
+def question_records(run_id, subreddit_name, questions, generated_at):
+    """Run log records for the questions generated for one subreddit"""
+    records = []
+    for q in questions:
+        meta = q.get('completion', {})
+        records.append({
+            'type': 'question',
+            'run_id': run_id,
+            'generated_at': generated_at,
+            'subreddit': subreddit_name,
+            'title': q['title'],
+            'content': q['content'],
+            'model': meta.get('model'),
+            'usage': meta.get('usage', {}),
+            'latency_ms': meta.get('latency_ms'),
+            'cached': meta.get('cached', False),
+            'batch_size': meta.get('batch_size', 1)
+        })
+    return records
+
+def response_records(run_id, subreddit_name, responses, generated_at):
+    """Run log records for the responses generated for one subreddit"""
+    records = []
+    for r in responses:
+        meta = r.get('completion', {})
+        post = r['post']
+        records.append({
+            'type': 'response',
+            'run_id': run_id,
+            'generated_at': generated_at,
+            'subreddit': subreddit_name,
+            'post_id': post.get('id'),
+            'url': post.get('url'),
+            'post_title': post.get('title'),
+            'author': post.get('author'),
+            'relevance': post.get('relevance'),
+            'content': r['response'],
+            'model': meta.get('model'),
+            'usage': meta.get('usage', {}),
+            'latency_ms': meta.get('latency_ms'),
+            'cached': meta.get('cached', False),
+            'batch_size': meta.get('batch_size', 1)
+        })
+    return records
+
+class RunLog:
+    """Appends records to the current monthly segment; safe to share across threads"""
+
+    def __init__(self, log_dir=None, compress=None):
+        self.log_dir = log_dir or RUN_LOG_DIR
+        self.compress = RUN_LOG_COMPRESS if compress is None else compress
+        self.records = 0
+        self._lock = threading.Lock()
+
+    def segment_path(self):
+        """File the next append goes to"""
+        return os.path.join(self.log_dir, segment_name(datetime.now(), self.compress))
+
+    def append(self, records):
+        """Write records as compact JSON lines and flush them to disk"""
+        if not records:
+            return
+
+        data = ''.join(
+            json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+            for record in records
+        ).encode('utf-8')
+        path = self.segment_path()
+
+        with self._lock:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            # Each append to a .gz segment adds a gzip member; readers see one stream
+            opener = gzip.open if self.compress else open
+            with opener(path, 'ab') as f:
+                f.write(data)
+            self.records += len(records)
+
+def list_segments(log_dir=None, since=None, until=None):
+    """Segment paths in chronological order, limited to the months overlapping since/until"""
+    log_dir = log_dir or RUN_LOG_DIR
+    try:
+        names = os.listdir(log_dir)
+    except FileNotFoundError:
+        return []
+
+    segments = []
+    for name in names:
+        if not name.startswith(SEGMENT_PREFIX) or not name.endswith(('.jsonl', '.jsonl.gz')):
+            continue
+        month = name[len(SEGMENT_PREFIX):len(SEGMENT_PREFIX) + 7]
+        if since and month < since[:7]:
+            continue
+        if until and month > until[:7]:
+            continue
+        segments.append(name)
+
+    return [os.path.join(log_dir, name) for name in sorted(segments)]
+
+def iter_records(kind=None, subreddit=None, since=None, until=None, url=None, log_dir=None):
+    """Stream matching records from the run log, oldest first
+
+    since/until are ISO timestamps ('YYYY-MM-DD' or longer) compared against
+    generated_at. Only overlapping monthly segments are opened, and lines
+    that cannot match are skipped before being parsed.
+    """
+    needles = []
+    if subreddit:
+        needles.append(json.dumps(subreddit, ensure_ascii=False))
+    if url:
+        needles.append(json.dumps(url, ensure_ascii=False))
+
+    for path in list_segments(log_dir, since, until):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if any(needle not in line for needle in needles):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crashed run
+                    continue
+                if kind and record.get('type') != kind:
+                    continue
+                if subreddit and record.get('subreddit') != subreddit:
+                    continue
+                if url and record.get('url') != url:
+                    continue
+                if since and record.get('generated_at', '') < since:
+                    continue
+                if until and record.get('generated_at', '') > until:
+                    continue
+                yield record
+
+def render_records(records):
+    """Re-render records as the █-separated text of the master files
+
+    Consecutive records of the same type, run and subreddit form one block.
+    """
+    from reddit_automation import format_questions_content, format_responses_content
+
+    def render(group):
+        first = group[0]
+        if first['type'] == 'question':
+            return format_questions_content(first['subreddit'], group, timestamp=first['generated_at'])
+        responses = [{
+            'post': {'title': r['post_title'], 'author': r['author'], 'url': r['url']},
+            'response': r['content']
+        } for r in group]
+        return format_responses_content(first['subreddit'], responses, timestamp=first['generated_at'])
+
+    group = []
+    for record in records:
+        if group and (record['type'], record['run_id'], record['subreddit']) != \
+                (group[0]['type'], group[0]['run_id'], group[0]['subreddit']):
+            yield render(group)
+            group = []
+        group.append(record)
+    if group:
+        yield render(group)
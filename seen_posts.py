@@ -0,0 +1,55 @@
+"""
+Seen-Post Index
+Append-only record of Reddit posts that already have a generated response
+"""
+
+import os
+import threading
+
+SEEN_POSTS_FILE = "/home/ubuntu/seen_posts.txt"
+
+def post_key(post):
+    """Stable key for a post: the Reddit fullname (t3_xxx), else its URL"""
+    return post.get('id') or post.get('url', '')
+
+class SeenPostIndex:
+    """Set of processed post keys backed by an append-only text file"""
+
+    def __init__(self, path=None):
+        self.path = path = path or SEEN_POSTS_FILE
+        self._lock = threading.Lock()
+        self._keys = set()
+
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    key = line.strip()
+                    if key:
+                        self._keys.add(key)
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, post):
+        return post_key(post) in self._keys
+
+    def mark(self, posts):
+        """Record posts as processed, persisting any new keys"""
+        with self._lock:
+            new_keys = []
+            for post in posts:
+                key = post_key(post)
+                if key and key not in self._keys:
+                    self._keys.add(key)
+                    new_keys.append(key)
+
+            if new_keys:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write(''.join(f"{key}\n" for key in new_keys))
+
+            return len(new_keys)
@@ -0,0 +1,101 @@
+"""
+Subreddit Sharding
+Deterministic split of the subreddit config across processes or CI jobs, and the per-shard record files merged afterwards
+"""
+
+import hashlib
+import json
+import os
+
+from run_log import RunLog
+
+SHARD_DIR = "/home/ubuntu/shards"
+
+SHARD_PREFIX = 'shard-'
+
+def parse_shard(value):
+    """(index, count) from 'I/N' with 0 <= I < N, e.g. '0/4'"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"shard must look like I/N, got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard index must be in 0..N-1, got {value!r}")
+    return index, count
+
+def shard_of(subreddit_name, count):
+    """Shard a subreddit belongs to; stable across runs, machines and config reordering"""
+    digest = hashlib.sha1(subreddit_name.lower().encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+def select_shard(subreddits, index, count):
+    """The subreddits (in config order) that belong to shard `index` of `count`"""
+    return {name: config for name, config in subreddits.items() if shard_of(name, count) == index}
+
+def shard_file(index, count, shard_dir=None):
+    """Path of the record file written by shard `index` of `count`"""
+    return os.path.join(shard_dir or SHARD_DIR, f"{SHARD_PREFIX}{index}-of-{count}.jsonl")
+
+def list_shard_files(shard_dir=None):
+    """Shard record files waiting to be merged"""
+    shard_dir = shard_dir or SHARD_DIR
+    try:
+        names = os.listdir(shard_dir)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(shard_dir, name) for name in sorted(names)
+            if name.startswith(SHARD_PREFIX) and name.endswith('.jsonl')]
+
+def cursor_record(subreddit_name, newest, unanswered=(), capped=False):
+    """Shard file record of the cursor a subreddit moves to once its shard is merged (see settle_cursor)"""
+    return {'type': 'cursor', 'subreddit': subreddit_name, 'newest': newest,
+            'unanswered': list(unanswered), 'capped': capped}
+
+def read_shard_records(paths, subreddit_order=()):
+    """All records from the shard files, grouped into config order (file order within a subreddit)"""
+    records = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A torn last line from a crashed shard
+                    continue
+
+    position = {name: i for i, name in enumerate(subreddit_order)}
+    records.sort(key=lambda record: position.get(record.get('subreddit'), len(position)))
+    return records
+
+def drop_shard_records(paths, record_type):
+    """Rewrite the shard files without their records of one type, once the merge has published them"""
+    for path in paths:
+        kept = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('type') != record_type:
+                    kept.append(line)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(kept)
+        os.replace(tmp_path, path)
+
+class ShardLog(RunLog):
+    """Run log writer whose records all go to one shard file instead of monthly segments
+
+    The file is started afresh, so a shard run twice before a merge leaves
+    only its latest records.
+    """
+
+    def __init__(self, path):
+        super().__init__(log_dir=os.path.dirname(path), compress=False)
+        self.path = path
+        os.makedirs(self.log_dir or '.', exist_ok=True)
+        open(path, 'w').close()
+
+    def segment_path(self):
+        return self.path
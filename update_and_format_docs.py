@@ -3,10 +3,15 @@
 Update Google Docs with content and apply bold formatting
 """
 
+import json
+import os
 import sys
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+import threading
+from datetime import datetime
+from metrics import METRICS
+
+# The Google client libraries are imported inside the functions that need them,
+# so importing this module (e.g. for build_append_requests) stays cheap
 
 # Document IDs
 QUESTIONS_DOC_ID = "1CYECMcw8pPu-a7H27ChbKcRWVnV7PQJKy5QHsSvJElw"
@@ -14,87 +19,233 @@ COMMENTS_DOC_ID = "1trD4JzyBQtHEKXt0lVWPfayGo89kM182T_HXAupYP3A"
 
 SCOPES = ['https://www.googleapis.com/auth/documents']
 
+# Cached end index and revision id per document, so appends don't re-read the document
+DOCS_STATE_FILE = '/home/ubuntu/docs_state.json'
+
+# Segments of each configured document: appends go to the newest segment, and a new
+# document is created once a segment passes SEGMENT_MAX_CHARS or the month changes
+DOCS_SEGMENTS_FILE = '/home/ubuntu/docs_segments.json'
+SEGMENT_MAX_CHARS = int(os.environ.get('DOCS_SEGMENT_MAX_CHARS', 500_000))
+SEGMENT_BY_MONTH = True
+
+# Lines starting with these are bolded
+BOLD_PREFIXES = ('GENERATED:', 'QUESTION ', 'RESPONSE ', 'TITLE:', 'POST BODY:',
+                 'YOUR RESPONSE:', 'POST:', 'AUTHOR:', 'URL:')
+
+_service = None
+_segments_lock = threading.Lock()
+
 def get_credentials():
     """Load credentials from token file"""
+    from google.oauth2.credentials import Credentials
+    
     token_file = '/home/ubuntu/token.json'
     creds = Credentials.from_authorized_user_file(token_file, SCOPES)
     return creds
 
-def append_and_format(service, doc_id, content):
-    """Append content and apply bold formatting to titles/headers"""
+def utf16_len(text):
+    """Length of text in UTF-16 code units, the unit of Google Docs indexes"""
+    return len(text.encode('utf-16-le')) // 2
+
+def should_bold(line):
+    """Whether a line of generated content is a title/header that gets bolded"""
+    text_stripped = line.strip()
+    if not text_stripped:
+        return False
+    return ('=' * 10 in line or '-' * 10 in line or
+            text_stripped.startswith(BOLD_PREFIXES))
+
+def build_append_requests(start_index, text):
+    """Insert request plus bold ranges computed from the inserted text's own offsets"""
+    requests = [{
+        'insertText': {
+            'location': {'index': start_index},
+            'text': text
+        }
+    }]
+    
+    index = start_index
+    for line in text.split('\n'):
+        length = utf16_len(line)
+        if length and should_bold(line):
+            requests.append({
+                'updateTextStyle': {
+                    'range': {
+                        'startIndex': index,
+                        'endIndex': index + length
+                    },
+                    'textStyle': {'bold': True},
+                    'fields': 'bold'
+                }
+            })
+        index += length + 1
+    
+    return requests
+
+def load_docs_state(state_file=None):
+    """Load the cached end index/revision of each document"""
+    state_file = state_file or DOCS_STATE_FILE
     try:
-        # Step 1: Get current end index
-        document = service.documents().get(documentId=doc_id).execute()
-        end_index = document.get('body').get('content')[-1].get('endIndex') - 1
-        
-        # Step 2: Insert the text
-        insert_request = [{
-            'insertText': {
-                'location': {'index': end_index},
-                'text': f'\n\n{content}'
-            }
-        }]
-        
-        service.documents().batchUpdate(
+        with open(state_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_docs_state(state, state_file=None):
+    """Persist the cached end index/revision of each document"""
+    state_file = state_file or DOCS_STATE_FILE
+    try:
+        tmp_file = f"{state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, state_file)
+    except OSError as e:
+        print(f'Could not save Docs state: {e}')
+
+def read_end_state(service, doc_id):
+    """Read the current end index and revision, fetching only those fields"""
+    with METRICS.stage('docs_get'):
+        document = service.documents().get(
             documentId=doc_id,
-            body={'requests': insert_request}
+            fields='revisionId,body.content(endIndex)'
         ).execute()
+    return {
+        'end_index': document.get('body').get('content')[-1].get('endIndex') - 1,
+        'revision_id': document.get('revisionId')
+    }
+
+def load_segments(segments_file=None):
+    """Load the segment index: {base doc id: {'title', 'segments': [{'doc_id', 'month', 'created_at'}]}}"""
+    segments_file = segments_file or DOCS_SEGMENTS_FILE
+    try:
+        with open(segments_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_segments(segments, segments_file=None):
+    """Persist the segment index atomically"""
+    segments_file = segments_file or DOCS_SEGMENTS_FILE
+    directory = os.path.dirname(segments_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_file = f"{segments_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(segments, f, indent=2)
+    os.replace(tmp_file, segments_file)
+
+def current_segment_id(base_doc_id, segments_file=None):
+    """Document currently receiving appends for a configured document (no API calls)"""
+    entry = load_segments(segments_file).get(base_doc_id)
+    return entry['segments'][-1]['doc_id'] if entry and entry.get('segments') else base_doc_id
+
+def resolve_segment(service, base_doc_id, incoming_chars=0, state_file=None, segments_file=None, now=None):
+    """Document an append of incoming_chars to base_doc_id should go to, rolling over if needed
+    
+    The base document is adopted as the first segment. A new segment is
+    created when the current one would pass SEGMENT_MAX_CHARS or (with
+    SEGMENT_BY_MONTH) was started in an earlier month. Segment sizes come
+    from the cached Docs state, so this only calls the API to roll over.
+    """
+    month = (now or datetime.now()).strftime('%Y-%m')
+    
+    with _segments_lock:
+        segments = load_segments(segments_file)
+        entry = segments.get(base_doc_id)
+        if not entry:
+            entry = segments[base_doc_id] = {
+                'title': None,
+                'segments': [{'doc_id': base_doc_id, 'month': month, 'created_at': None}]
+            }
+            save_segments(segments, segments_file)
         
-        # Step 3: Get the document again to find what we just inserted
-        document = service.documents().get(documentId=doc_id).execute()
+        current = entry['segments'][-1]
+        state = load_docs_state(state_file)
+        doc_state = state.get(current['doc_id'])
+        if not doc_state:
+            # Cached for the append that follows, which then needs no read of its own
+            doc_state = state[current['doc_id']] = read_end_state(service, current['doc_id'])
+            save_docs_state(state, state_file)
+        size = doc_state['end_index']
         
-        # Step 4: Find and format the newly added text
-        format_requests = []
-        content_elements = document.get('body').get('content')
+        full = size > 1 and size + incoming_chars > SEGMENT_MAX_CHARS
+        stale = SEGMENT_BY_MONTH and current['month'] != month
+        if not (full or stale):
+            return current['doc_id']
         
-        for element in content_elements:
-            if 'paragraph' in element:
-                paragraph = element['paragraph']
-                if 'elements' in paragraph:
-                    for elem in paragraph['elements']:
-                        if 'textRun' in elem:
-                            text_run = elem['textRun']
-                            text = text_run.get('content', '')
-                            start_index = elem['startIndex']
-                            end_index = elem['endIndex']
-                            
-                            # Only format if this is in the range we just added
-                            if start_index >= end_index - len(content) - 10:
-                                text_stripped = text.strip()
-                                should_bold = False
-                                
-                                if text_stripped:
-                                    # Check patterns
-                                    if ('=' * 10 in text or '-' * 10 in text or
-                                        text_stripped.startswith('GENERATED:') or
-                                        text_stripped.startswith('QUESTION ') or
-                                        text_stripped.startswith('RESPONSE ') or
-                                        text_stripped.startswith('TITLE:') or
-                                        text_stripped.startswith('POST BODY:') or
-                                        text_stripped.startswith('YOUR RESPONSE:') or
-                                        text_stripped.startswith('POST:') or
-                                        text_stripped.startswith('AUTHOR:') or
-                                        text_stripped.startswith('URL:')):
-                                        should_bold = True
-                                
-                                if should_bold:
-                                    format_requests.append({
-                                        'updateTextStyle': {
-                                            'range': {
-                                                'startIndex': start_index,
-                                                'endIndex': end_index
-                                            },
-                                            'textStyle': {'bold': True},
-                                            'fields': 'bold'
-                                        }
-                                    })
+        if not entry.get('title'):
+            with METRICS.stage('docs_get'):
+                entry['title'] = service.documents().get(documentId=base_doc_id, fields='title').execute().get('title')
+        number = len(entry['segments']) + 1
+        title = f"{entry['title'] or base_doc_id} ({month} #{number})"
         
-        # Step 5: Apply formatting
-        if format_requests:
-            service.documents().batchUpdate(
-                documentId=doc_id,
-                body={'requests': format_requests}
-            ).execute()
+        with METRICS.stage('docs_create'):
+            document = service.documents().create(body={'title': title}).execute()
+        doc_id = document['documentId']
+        entry['segments'].append({
+            'doc_id': doc_id,
+            'month': month,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        save_segments(segments, segments_file)
+        
+        # A new document's body ends at index 1; seeding its state saves a read
+        state[doc_id] = {'end_index': 1, 'revision_id': document.get('revisionId')}
+        save_docs_state(state, state_file)
+        
+        reason = 'size limit' if full else 'new month'
+        print(f"   ✓ Started Docs segment #{number} ({reason}): https://docs.google.com/document/d/{doc_id}/edit")
+        return doc_id
+
+def append_to_document(service, base_doc_id, content, state_file=None, segments_file=None):
+    """Append content to the current segment of a configured document (see resolve_segment)"""
+    try:
+        doc_id = resolve_segment(service, base_doc_id, utf16_len(content) + 2, state_file, segments_file)
+    except Exception as e:
+        print(f'Could not resolve Docs segment for {base_doc_id}: {e}')
+        return False
+    return append_and_format(service, doc_id, content, state_file)
+
+def append_and_format(service, doc_id, content, state_file=None):
+    """Append content and apply bold formatting to titles/headers
+    
+    The insert and all bold ranges go out in a single batchUpdate. The end
+    index is taken from the local state file and guarded by the document's
+    revision id, so the document is only re-read when someone else has
+    edited it since our last append.
+    """
+    from googleapiclient.errors import HttpError
+    
+    try:
+        text = f'\n\n{content}'
+        state = load_docs_state(state_file)
+        doc_state = state.get(doc_id)
+        from_cache = bool(doc_state and doc_state.get('revision_id'))
+        
+        for attempt in range(2):
+            if not from_cache:
+                doc_state = read_end_state(service, doc_id)
+            
+            body = {'requests': build_append_requests(doc_state['end_index'], text)}
+            if doc_state.get('revision_id'):
+                body['writeControl'] = {'requiredRevisionId': doc_state['revision_id']}
+            
+            try:
+                with METRICS.stage('docs_batch_update'):
+                    result = service.documents().batchUpdate(documentId=doc_id, body=body).execute()
+                break
+            except HttpError as error:
+                # Stale cached state (document changed elsewhere): re-read once and retry
+                if from_cache and error.resp.status == 400:
+                    from_cache = False
+                    continue
+                raise
+        
+        state[doc_id] = {
+            'end_index': doc_state['end_index'] + utf16_len(text),
+            'revision_id': (result.get('writeControl') or {}).get('requiredRevisionId')
+        }
+        save_docs_state(state, state_file)
         
         return True
         
@@ -107,66 +258,80 @@ def append_and_format(service, doc_id, content):
         traceback.print_exc()
         return False
 
-def update_docs(questions_file, responses_file):
-    """Update both Google Docs with formatted content"""
+def get_docs_service():
+    """Return the shared Docs service, building it on first use
+    
+    Uses the discovery document bundled with google-api-python-client, so
+    building the service makes no discovery round-trip.
+    """
+    global _service
+    
+    if _service is None:
+        from googleapiclient.discovery import build
+        _service = build('docs', 'v1', credentials=get_credentials(),
+                         static_discovery=True, cache_discovery=False)
+    return _service
+
+def update_docs(questions_content, responses_content, service=None):
+    """Update both Google Docs with formatted content
+    
+    Takes the content as in-memory strings; service defaults to the shared
+    Docs service. Returns True if every non-empty update succeeded.
+    """
     
     print("=" * 80)
     print("UPDATING GOOGLE DOCS (WITH FORMATTING)")
     print("=" * 80)
     print()
     
-    # Get credentials
-    creds = get_credentials()
-    
-    # Build the service
-    service = build('docs', 'v1', credentials=creds)
-    
-    # Read and update questions
-    try:
-        with open(questions_file, 'r') as f:
-            questions_content = f.read()
-        
-        print(f"📝 Updating Questions Doc...")
-        print(f"   File: {questions_file}")
-        print(f"   Length: {len(questions_content)} characters")
-        
-        if append_and_format(service, QUESTIONS_DOC_ID, questions_content):
-            print(f"   ✅ Success (with bold formatting)!")
-        else:
-            print(f"   ❌ Failed")
-        print()
-        
-    except Exception as e:
-        print(f"❌ Error with questions: {str(e)}")
-        print()
+    if service is None:
+        service = get_docs_service()
     
-    # Read and update responses
-    try:
-        with open(responses_file, 'r') as f:
-            responses_content = f.read()
+    ok = True
+    for label, doc_name, doc_id, content in (
+        ("📝", "Questions", QUESTIONS_DOC_ID, questions_content),
+        ("💬", "Comments", COMMENTS_DOC_ID, responses_content),
+    ):
+        if not content:
+            print(f"{label} {doc_name} Doc: nothing to append")
+            print()
+            continue
         
-        print(f"💬 Updating Comments Doc...")
-        print(f"   File: {responses_file}")
-        print(f"   Length: {len(responses_content)} characters")
-        
-        if append_and_format(service, COMMENTS_DOC_ID, responses_content):
-            print(f"   ✅ Success (with bold formatting)!")
-        else:
-            print(f"   ❌ Failed")
-        print()
-        
-    except Exception as e:
-        print(f"❌ Error with responses: {str(e)}")
-        print()
+        try:
+            print(f"{label} Updating {doc_name} Doc...")
+            print(f"   Length: {len(content)} characters")
+            
+            if append_to_document(service, doc_id, content):
+                print(f"   ✅ Success (with bold formatting)!")
+            else:
+                print(f"   ❌ Failed")
+                ok = False
+            print()
+            
+        except Exception as e:
+            print(f"❌ Error with {doc_name.lower()}: {str(e)}")
+            print()
+            ok = False
     
     print("=" * 80)
-    print("✅ GOOGLE DOCS UPDATED!")
+    print("✅ GOOGLE DOCS UPDATED!" if ok else "⚠ GOOGLE DOCS PARTIALLY UPDATED")
     print("=" * 80)
     print()
     print("View your docs:")
-    print(f"  Questions: https://docs.google.com/document/d/{QUESTIONS_DOC_ID}/edit")
-    print(f"  Comments:  https://docs.google.com/document/d/{COMMENTS_DOC_ID}/edit")
+    print(f"  Questions: https://docs.google.com/document/d/{current_segment_id(QUESTIONS_DOC_ID)}/edit")
+    print(f"  Comments:  https://docs.google.com/document/d/{current_segment_id(COMMENTS_DOC_ID)}/edit")
     print()
+    
+    return ok
+
+def update_docs_from_files(questions_file, responses_file):
+    """Update both Google Docs from the contents of two output files"""
+    with open(questions_file, 'r') as f:
+        questions_content = f.read()
+    with open(responses_file, 'r') as f:
+        responses_content = f.read()
+    
+    return update_docs(questions_content, responses_content)
 
 if __name__ == '__main__':
     if len(sys.argv) != 3:
@@ -177,7 +342,8 @@ if __name__ == '__main__':
     responses_file = sys.argv[2]
     
     try:
-        update_docs(questions_file, responses_file)
+        if not update_docs_from_files(questions_file, responses_file):
+            sys.exit(1)
     except Exception as e:
         print()
         print("❌ ERROR")
@@ -186,3 +352,4 @@ if __name__ == '__main__':
         print()
         import traceback
         traceback.print_exc()
+        sys.exit(1)